@@ -1,8 +1,12 @@
 import logging
 import os
+from collections.abc import AsyncIterator
 
 from fastapi import HTTPException
-from openai import OpenAI
+from openai import AsyncOpenAI
+
+from app.services.cache import MISSING, TwoTierCache
+from app.services.redis import async_redis_session
 
 logger = logging.getLogger(__name__)
 
@@ -15,23 +19,57 @@ Only give me themes numerated from 1 to 5 and nothing else.
 Ответь на русском языке.
 После конца каждой темы ставь символ $ и не переходи на следующую строку
 """
+# Bump on every change of `PROMPT` or `MODEL`, so stale themes aren't served
+PROMPT_VERSION = 1
+
+DISCUSSIONS_CACHE_SIZE = 256
+DISCUSSIONS_CACHE_TTL = int(os.getenv("DISCUSSIONS_CACHE_TTL", "2592000"))  # 30 days
 
-client = OpenAI(
+client = AsyncOpenAI(
     base_url="https://openrouter.ai/api/v1",
     api_key=API_KEY,
 )
 
+discussions_cache = TwoTierCache(
+    async_redis_session, "discussions:", DISCUSSIONS_CACHE_SIZE
+)
+
+
+def get_cache_key(film_name: str, year: int) -> str:
+    film_name = " ".join(film_name.lower().split())
+    return f"v{PROMPT_VERSION}:{film_name}:{year}"
+
+
+class ThemesParser:
+    """Splits the answer into themes, as soon as their `$` delimiter arrives."""
+
+    def __init__(self) -> None:
+        self._buffer = ""
 
-def get_discussions(film_name: str, year: int) -> list[str]:
+    def feed(self, text: str) -> list[str]:
+        # Text after the last delimiter is an unfinished theme (or empty string)
+        *themes, self._buffer = (self._buffer + text).split("$")
+        return [theme.strip() for theme in themes]
+
+
+def parse_themes(text: str) -> list[str]:
+    return ThemesParser().feed(text)
+
+
+def get_messages(film_name: str, year: int) -> list[dict[str, str]]:
+    return [
+        {
+            "role": "user",
+            "content": PROMPT.format(film_name=film_name, year=year),
+        },
+    ]
+
+
+async def generate_discussions(film_name: str, year: int) -> list[str]:
     try:
-        completion = client.chat.completions.create(
+        completion = await client.chat.completions.create(
             model=MODEL,
-            messages=[
-                {
-                    "role": "user",
-                    "content": PROMPT.format(film_name=film_name, year=year),
-                },
-            ],
+            messages=get_messages(film_name, year),  # type: ignore
         )
 
         text = completion.choices[0].message.content
@@ -41,11 +79,57 @@ def get_discussions(film_name: str, year: int) -> list[str]:
         if text is None:
             text = "Sorry, couldn't find any discussion options for you :("
 
-        # Except last empty string
-        themes = [x.strip() for x in text.split("$")][:-1]
+        themes = parse_themes(text)
 
     except Exception as e:
         raise HTTPException(status_code=500, detail="OpenAI API error") from e
 
     else:
         return themes
+
+
+async def get_discussions(film_name: str, year: int) -> list[str]:
+    key = get_cache_key(film_name, year)
+
+    themes = await discussions_cache.get(key)
+    if themes is not MISSING:
+        return themes
+
+    themes = await generate_discussions(film_name, year)
+
+    # Nothing to reuse in an empty answer, it's better to ask again next time
+    if themes:
+        await discussions_cache.set(key, themes, DISCUSSIONS_CACHE_TTL)
+
+    return themes
+
+
+async def stream_discussions(film_name: str, year: int) -> AsyncIterator[str]:
+    """Yield themes one by one, while the model is still generating the rest."""
+    key = get_cache_key(film_name, year)
+
+    themes = await discussions_cache.get(key)
+    if themes is not MISSING:
+        for theme in themes:
+            yield theme
+        return
+
+    parser = ThemesParser()
+    themes = []
+
+    stream = await client.chat.completions.create(
+        model=MODEL,
+        messages=get_messages(film_name, year),  # type: ignore
+        stream=True,
+    )
+
+    async for chunk in stream:
+        if not chunk.choices or not chunk.choices[0].delta.content:
+            continue
+
+        for theme in parser.feed(chunk.choices[0].delta.content):
+            themes.append(theme)
+            yield theme
+
+    if themes:
+        await discussions_cache.set(key, themes, DISCUSSIONS_CACHE_TTL)
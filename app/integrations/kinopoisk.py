@@ -1,72 +1,238 @@
 from __future__ import annotations
 
+import asyncio
+import contextlib
+import hashlib
+import itertools
+import json
 import logging
 import os
-from typing import Any, TypedDict
+import time
+from collections.abc import Awaitable, Callable
+from datetime import UTC, datetime, timedelta
+from typing import Any, TypedDict, TypeVar
 
 import aiohttp
 from fastapi import HTTPException
+from redis import RedisError
+from redis.asyncio import Redis
 from sqlmodel import SQLModel
 from starlette import status
 
 from app.models import Film
+from app.services.cache import MISSING, TwoTierCache
+from app.services.redis import async_redis_session
+
+T = TypeVar("T")
 
 KINOPOLISK_API_URL = "https://kinopoiskapiunofficial.tech/api/v2.2"
-KINOPOISK_API_TIMEOUT = 1  # second
+# Hung API fails fast, instead of holding pooled connections, in seconds
+KINOPOISK_API_TIMEOUT = float(os.getenv("KINOPOISK_API_TIMEOUT", "10"))
+# Includes waiting for a free connection of the pool
+KINOPOISK_CONNECT_TIMEOUT = float(os.getenv("KINOPOISK_CONNECT_TIMEOUT", "2"))
+KINOPOISK_READ_TIMEOUT = float(os.getenv("KINOPOISK_READ_TIMEOUT", "5"))
 
 KINOPOISK_API_KEYS = os.environ["KINOPOISK_API_KEYS"].split(",")
+KINOPOISK_DAILY_QUOTA = int(os.getenv("KINOPOISK_DAILY_QUOTA", "500"))
+KINOPOISK_RATE_LIMIT_COOLDOWN = 1  # second
+
+# Connection pool of the shared HTTP session
+KINOPOISK_POOL_SIZE = int(os.getenv("KINOPOISK_POOL_SIZE", "100"))
+KINOPOISK_POOL_SIZE_PER_HOST = int(os.getenv("KINOPOISK_POOL_SIZE_PER_HOST", "20"))
+KINOPOISK_KEEPALIVE_TIMEOUT = 30  # seconds
+KINOPOISK_DNS_CACHE_TTL = 300  # seconds
+
+# Genres catalogue (`/films/filters`) barely ever changes
+KINOPOISK_GENRES_CACHE_KEY = "kinopoisk:genres"
+KINOPOISK_GENRES_CACHE_TTL = int(os.getenv("KINOPOISK_GENRES_CACHE_TTL", "86400"))
+KINOPOISK_GENRES_REFRESH_INTERVAL = KINOPOISK_GENRES_CACHE_TTL // 2
+
+# Responses cache, TTLs are in seconds
+KINOPOISK_CACHE_SIZE = int(os.getenv("KINOPOISK_CACHE_SIZE", "1024"))
+KINOPOISK_SEARCH_CACHE_TTL = int(os.getenv("KINOPOISK_SEARCH_CACHE_TTL", "600"))
+KINOPOISK_FILM_CACHE_TTL = int(os.getenv("KINOPOISK_FILM_CACHE_TTL", "86400"))
+KINOPOISK_NOT_FOUND_CACHE_TTL = int(
+    os.getenv("KINOPOISK_NOT_FOUND_CACHE_TTL", "3600"),
+)
 
 
 class OutOfTokensError(Exception): ...
 
 
-class TokenStorage:
-    def __init__(self, tokens: list[str]) -> None:
-        self.tokens = tokens
-        self.selected_token_i = 0
+# Picks the least used key, which is not cooling down and still has quota.
+# KEYS: daily usage hash, then cooldown key of every token
+# ARGV: daily quota, usage hash TTL, then fingerprint of every token
+ACQUIRE_TOKEN_SCRIPT = """
+local quota = tonumber(ARGV[1])
+local best, best_used
+
+for i = 2, #KEYS do
+    if redis.call("EXISTS", KEYS[i]) == 0 then
+        local fingerprint = ARGV[i + 1]
+        local used = tonumber(redis.call("HGET", KEYS[1], fingerprint) or "0")
+
+        if used < quota and (best == nil or used < best_used) then
+            best, best_used = fingerprint, used
+        end
+    end
+end
+
+if best == nil then
+    return nil
+end
+
+redis.call("HINCRBY", KEYS[1], best, 1)
+redis.call("EXPIRE", KEYS[1], ARGV[2])
+
+return best
+"""
+
+
+class TokenScheduler:
+    """Spreads requests across all API keys, keeping their state in Redis.
+
+    Every key has a daily quota; keys which got `402` are put in cooldown until
+    the quota resets and keys which got `429` - for a short while.
+    """
+
+    def __init__(self, tokens: list[str], redis: Redis) -> None:
+        self.tokens = {self.fingerprint(token): token for token in tokens}
+        self.redis = redis
+
+        self._acquire = redis.register_script(ACQUIRE_TOKEN_SCRIPT)
+
+        # Fallback, in case Redis is unavailable
+        self._round_robin = itertools.cycle(self.tokens)
+        self._cooldowns: dict[str, float] = {}
+
+    @staticmethod
+    def fingerprint(token: str) -> str:
+        # Keys themselves are never stored in Redis
+        return hashlib.sha256(token.encode()).hexdigest()[:16]
+
+    @staticmethod
+    def _cooldown_key(fingerprint: str) -> str:
+        return f"kinopoisk:tokens:cooldown:{fingerprint}"
+
+    @staticmethod
+    def _until_quota_reset() -> int:
+        now = datetime.now(tz=UTC)
+        reset = (now + timedelta(days=1)).replace(
+            hour=0, minute=0, second=0, microsecond=0
+        )
+
+        return max(int((reset - now).total_seconds()), 1)
+
+    def _acquire_locally(self) -> str:
+        now = time.monotonic()
+
+        for _ in range(len(self.tokens)):
+            fingerprint = next(self._round_robin)
+
+            if self._cooldowns.get(fingerprint, 0) <= now:
+                return self.tokens[fingerprint]
+
+        raise OutOfTokensError
 
-    def swap(self) -> None:
-        cur = self.selected_token_i
+    async def acquire(self) -> str:
+        usage_key = f"kinopoisk:tokens:usage:{datetime.now(tz=UTC).date()}"
+        fingerprints = list(self.tokens)
 
-        # Last token already selected :(
-        if cur + 1 == len(self.tokens):
+        try:
+            fingerprint = await self._acquire(
+                keys=[usage_key, *map(self._cooldown_key, fingerprints)],
+                args=[KINOPOISK_DAILY_QUOTA, 2 * 24 * 60 * 60, *fingerprints],
+            )
+        except RedisError:
+            logger.warning("Failed to acquire token via Redis", exc_info=True)
+            return self._acquire_locally()
+
+        if fingerprint is None:
             raise OutOfTokensError
 
-        self.selected_token_i += 1
+        return self.tokens[fingerprint.decode()]
+
+    async def report(self, token: str, status_code: int) -> None:
+        if status_code == status.HTTP_402_PAYMENT_REQUIRED:
+            cooldown = self._until_quota_reset()
+        elif status_code == status.HTTP_429_TOO_MANY_REQUESTS:
+            cooldown = KINOPOISK_RATE_LIMIT_COOLDOWN
+        else:
+            return
 
-    def get(self) -> str:
-        return self.tokens[self.selected_token_i]
+        fingerprint = self.fingerprint(token)
+        logger.warning(
+            "Token %s got %s, cooling down for %ss", fingerprint, status_code, cooldown
+        )
 
-    def get_header(self) -> dict[str, str]:
-        return {"X-API-KEY": self.get()}
+        self._cooldowns[fingerprint] = time.monotonic() + cooldown
 
-    def tokens_left(self) -> bool:
-        return (len(self.tokens) - self.selected_token_i - 1) >= 1
+        try:
+            await self.redis.set(
+                self._cooldown_key(fingerprint), status_code, ex=cooldown
+            )
+        except RedisError:
+            logger.warning("Failed to store token cooldown in Redis", exc_info=True)
 
 
-tokens = TokenStorage(KINOPOISK_API_KEYS)
+tokens = TokenScheduler(KINOPOISK_API_KEYS, async_redis_session)
 
 
 class KinopoiskClient:
-    def __init__(self, api_url: str, tokens: TokenStorage) -> None:
+    def __init__(self, api_url: str, tokens: TokenScheduler) -> None:
         self.api_url = api_url
         self.tokens = tokens
 
         self.stats = {}
 
+        self._session: aiohttp.ClientSession | None = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        # Created lazily, as `aiohttp` requires a running event loop
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=KINOPOISK_POOL_SIZE,
+                limit_per_host=KINOPOISK_POOL_SIZE_PER_HOST,
+                keepalive_timeout=KINOPOISK_KEEPALIVE_TIMEOUT,
+                ttl_dns_cache=KINOPOISK_DNS_CACHE_TTL,
+            )
+            timeout = aiohttp.ClientTimeout(
+                total=KINOPOISK_API_TIMEOUT,
+                connect=KINOPOISK_CONNECT_TIMEOUT,
+                sock_read=KINOPOISK_READ_TIMEOUT,
+            )
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+        self._session = None
+
     async def get(self, url: str, **kwds) -> KinopoiskResponse:  # noqa: ANN003
         while True:
-            async with (
-                aiohttp.ClientSession() as session,
-                session.get(
-                    f"{self.api_url}/{url}",
-                    **kwds,
-                    headers=tokens.get_header(),
-                ) as response,
-            ):
-                if response.status == status.HTTP_402_PAYMENT_REQUIRED:
-                    logger.warning(f"SPENT: {self.stats}")  # noqa: G004
-                    tokens.swap()
+            try:
+                token = await self.tokens.acquire()
+            except OutOfTokensError:
+                logger.warning(f"SPENT: {self.stats}")  # noqa: G004
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Kinopoisk API is temporarily unavailable",
+                ) from None
+
+            async with self.session.get(
+                f"{self.api_url}/{url}",
+                **kwds,
+                headers={"X-API-KEY": token},
+            ) as response:
+                if response.status in {
+                    status.HTTP_402_PAYMENT_REQUIRED,
+                    status.HTTP_429_TOO_MANY_REQUESTS,
+                }:
+                    await self.tokens.report(token, response.status)
                     continue
 
                 if url in self.stats:
@@ -79,28 +245,144 @@ class KinopoiskClient:
                 )
 
 
+class SingleFlight:
+    """Collapses concurrent calls with the same key into a single upstream call."""
+
+    def __init__(self) -> None:
+        self._calls: dict[str, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: str, func: Callable[[], Awaitable[T]]) -> T:
+        call = self._calls.get(key)
+
+        if call is None:
+            call = asyncio.ensure_future(func())
+            self._calls[key] = call
+            call.add_done_callback(lambda _: self._calls.pop(key, None))
+
+        # Cancellation of one waiter must not cancel the call for the others
+        return await asyncio.shield(call)
+
+
 class KinopoiskResponse(TypedDict):
     status: int
     json: dict[str, Any]
 
 
 kinopoisk = KinopoiskClient(KINOPOLISK_API_URL, tokens)
+in_flight = SingleFlight()
 
 logger = logging.getLogger(__name__)
 
 
+class GenreCatalogue:
+    """Genre name -> Kinopoisk genre id map, cached in process and in Redis."""
+
+    def __init__(self, client: KinopoiskClient, redis: Redis, ttl: int) -> None:
+        self.client = client
+        self.redis = redis
+        self.ttl = ttl
+
+        self._genres: dict[str, int] = {}
+        self._expires_at = 0.0
+        self._lock = asyncio.Lock()
+        self._refresh_task: asyncio.Task | None = None
+
+    def _is_fresh(self) -> bool:
+        return bool(self._genres) and time.monotonic() < self._expires_at
+
+    async def _load_cached(self) -> dict[str, int] | None:
+        try:
+            cached = await self.redis.get(KINOPOISK_GENRES_CACHE_KEY)
+        except RedisError:
+            logger.warning("Failed to read genres from Redis", exc_info=True)
+            return None
+
+        return json.loads(cached) if cached else None
+
+    async def _load_upstream(self) -> dict[str, int]:
+        response = await self.client.get("/films/filters")
+        filters = response["json"]
+
+        genres = {genre["genre"]: genre["id"] for genre in filters["genres"]}
+
+        try:
+            await self.redis.set(
+                KINOPOISK_GENRES_CACHE_KEY, json.dumps(genres), ex=self.ttl
+            )
+        except RedisError:
+            logger.warning("Failed to store genres in Redis", exc_info=True)
+
+        return genres
+
+    async def load(self, *, force: bool = False) -> dict[str, int]:
+        if not force and self._is_fresh():
+            return self._genres
+
+        async with self._lock:
+            # Somebody else could have loaded it, while we were waiting
+            if not force and self._is_fresh():
+                return self._genres
+
+            genres = None if force else await self._load_cached()
+            if genres is None:
+                genres = await self._load_upstream()
+
+            self._genres = genres
+            self._expires_at = time.monotonic() + self.ttl
+
+        return self._genres
+
+    async def get_ids(self, genres_list: list[str]) -> list[int]:
+        if not genres_list:
+            return []
+
+        genres = await self.load()
+        wanted = set(genres_list)
+
+        return [genre_id for genre, genre_id in genres.items() if genre in wanted]
+
+    async def _refresh_forever(self, interval: int) -> None:
+        while True:
+            await asyncio.sleep(interval)
+
+            try:
+                await self.load(force=True)
+            except Exception:
+                logger.exception("Failed to refresh genres catalogue")
+
+    def start(self, interval: int = KINOPOISK_GENRES_REFRESH_INTERVAL) -> None:
+        if self._refresh_task is None:
+            self._refresh_task = asyncio.create_task(self._refresh_forever(interval))
+
+    async def stop(self) -> None:
+        if self._refresh_task is None:
+            return
+
+        self._refresh_task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self._refresh_task
+
+        self._refresh_task = None
+
+
+genres_catalogue = GenreCatalogue(
+    kinopoisk, async_redis_session, KINOPOISK_GENRES_CACHE_TTL
+)
+responses_cache = TwoTierCache(async_redis_session, "kinopoisk:", KINOPOISK_CACHE_SIZE)
+
+
 async def get_genre_ids(genres_list: list[str]) -> list[int]:
-    response = await kinopoisk.get("/films/filters")
+    return await genres_catalogue.get_ids(genres_list)
 
-    filters = response["json"]
 
-    return [genre["id"] for genre in filters["genres"] if genre["genre"] in genres_list]
+def _normalize_search(search: str) -> str:
+    return " ".join(search.lower().split())
 
 
-async def get_films_by_genres_and_keywords(
-    genre_ids: list[int],
-    search: str,
-) -> list[Film]:
+async def _search_films(genre_ids: list[int], search: str) -> list[Film]:
     logger.info(f"Genres: {genre_ids}, search: {search}")
 
     response = await kinopoisk.get(
@@ -133,13 +415,37 @@ async def get_films_by_genres_and_keywords(
     return films
 
 
-async def get_film_by_id(film_id: int) -> Film:
+async def _load_films(
+    key: str, genre_ids: list[int], search: str
+) -> list[dict[str, Any]]:
+    films_data = [film.model_dump() for film in await _search_films(genre_ids, search)]
+    await responses_cache.set(key, films_data, KINOPOISK_SEARCH_CACHE_TTL)
+
+    return films_data
+
+
+async def get_films_by_genres_and_keywords(
+    genre_ids: list[int],
+    search: str,
+) -> list[Film]:
+    genre_ids = sorted(set(genre_ids))
+    search = _normalize_search(search)
+
+    key = f"search:{','.join(map(str, genre_ids))}:{search}"
+    films_data = await responses_cache.get(key)
+
+    if films_data is MISSING:
+        films_data = await in_flight.do(
+            key, lambda: _load_films(key, genre_ids, search)
+        )
+
+    return [Film(**film_data) for film_data in films_data]
+
+
+async def _fetch_film(film_id: int) -> Film | None:
     response = await kinopoisk.get(f"/films/{film_id}")
     if response["status"] == status.HTTP_404_NOT_FOUND:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Film not found",
-        )
+        return None
 
     film_detail = response["json"]
 
@@ -153,3 +459,30 @@ async def get_film_by_id(film_id: int) -> Film:
         rating=film_detail["ratingKinopoisk"],
         film_url=film_detail["webUrl"],
     )
+
+
+async def _load_film(key: str, film_id: int) -> dict[str, Any] | None:
+    film = await _fetch_film(film_id)
+    film_data = film.model_dump() if film else None
+
+    # Unknown ids are cached as well, but for a shorter time
+    ttl = KINOPOISK_FILM_CACHE_TTL if film else KINOPOISK_NOT_FOUND_CACHE_TTL
+    await responses_cache.set(key, film_data, ttl)
+
+    return film_data
+
+
+async def get_film_by_id(film_id: int) -> Film:
+    key = f"film:{film_id}"
+    film_data = await responses_cache.get(key)
+
+    if film_data is MISSING:
+        film_data = await in_flight.do(key, lambda: _load_film(key, film_id))
+
+    if film_data is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Film not found",
+        )
+
+    return Film(**film_data)
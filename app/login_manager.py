@@ -1,16 +1,22 @@
+import hashlib
 import inspect
 import logging
 import os
+import secrets
 from datetime import UTC, datetime, timedelta
 from typing import Any, Callable
 
 import jwt
 from fastapi import HTTPException, Request
 from fastapi.security import OAuth2PasswordBearer, SecurityScopes
+from redis import RedisError
+from redis.asyncio import Redis
 from sqlmodel import select
 
 from app.models import User
-from app.services.postgres import get_session
+from app.services.cache import MISSING, LRUCache, TwoTierCache
+from app.services.postgres import async_session_maker
+from app.services.redis import async_redis_session
 
 UnauthorizedException = HTTPException(
     status_code=401,
@@ -20,6 +26,9 @@ UnauthorizedException = HTTPException(
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.WARNING)
 
+REVOKED_TOKENS_CACHE_SIZE = 4096
+REVOKED_TOKENS_CACHE_TTL = 5 * 60  # seconds
+
 
 class LoginManager(OAuth2PasswordBearer):
     def __init__(
@@ -27,12 +36,24 @@ class LoginManager(OAuth2PasswordBearer):
         token_url: str,
         secret: str,
         default_expiry: timedelta = timedelta(minutes=30),
+        user_cache: "TwoTierCache | None" = None,
+        user_cache_ttl: int = 60,
+        redis: "Redis | None" = None,
     ) -> None:
         super().__init__(token_url)
         self.default_expiry = default_expiry
         self.algorithm = "HS256"
         self.secret = secret
 
+        self.user_cache = user_cache
+        self.user_cache_ttl = user_cache_ttl
+
+        # Revocation time of every user is kept in Redis, tokens issued before
+        # it are rejected. Missing records mean nothing was revoked, so losing
+        # Redis data never logs anyone out.
+        self.redis = redis
+        self.revoked_tokens = LRUCache(REVOKED_TOKENS_CACHE_SIZE)
+
     async def _load_user(self, user_id: str) -> "Any | None":  # noqa: ANN401
         if self.user_getter_func is None:
             msg = "Missing user_loader callback"
@@ -45,6 +66,76 @@ class LoginManager(OAuth2PasswordBearer):
 
         return user
 
+    async def _cache_user(self, user_id: str, user: User) -> None:
+        if self.user_cache is None:
+            return
+
+        # Password hash is never needed after authentication
+        user_data = user.model_dump(exclude={"hashed_password"})
+        await self.user_cache.set(user_id, user_data, self.user_cache_ttl)
+
+    @staticmethod
+    def _revoked_key(user_id: str) -> str:
+        return f"access_tokens:revoked_at:{user_id}"
+
+    @staticmethod
+    def _fingerprint(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    async def _verify_token(
+        self,
+        user_id: str,
+        token: str,
+        issued_at: float,
+    ) -> Any:  # noqa: ANN401
+        """Check that the token wasn't revoked, reading cached user on the way.
+
+        Both are read in a single round trip to Redis.
+        Returns cached user data or `MISSING`.
+        """
+        fingerprint = self._fingerprint(token)
+
+        if self.revoked_tokens.get(fingerprint) is not MISSING:
+            logger.warning("Revoked token was used")
+            raise UnauthorizedException
+
+        cache = self.user_cache
+        user_data = cache.get_local(user_id) if cache else MISSING
+        read_user = user_data is MISSING and cache and cache.redis is not None
+
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:  # type: ignore
+                pipe.get(self._revoked_key(user_id))
+                if read_user:
+                    cache.queue_get(pipe, user_id)  # type: ignore
+
+                revoked_at, *cached = await pipe.execute()
+
+        except RedisError:
+            # Redis outage shouldn't take the whole API down with it
+            logger.warning("Failed to verify token, accepting it", exc_info=True)
+            return user_data
+
+        if revoked_at is not None and issued_at <= float(revoked_at):
+            logger.warning("Revoked token was used")
+            self.revoked_tokens.set(
+                fingerprint, value=True, ttl=REVOKED_TOKENS_CACHE_TTL
+            )
+            raise UnauthorizedException
+
+        if read_user:
+            user_data = cache.resolve(user_id, *cached)  # type: ignore
+
+        return user_data
+
+    async def invalidate_user(self, user_id: str) -> None:
+        """Drop cached user, must be called on logout and on any user change.
+
+        Other workers may still serve their in-memory copy until it expires.
+        """
+        if self.user_cache is not None:
+            await self.user_cache.delete(user_id)
+
     async def _request_to_token(self, request: Request) -> str:
         token = None
 
@@ -65,19 +156,33 @@ class LoginManager(OAuth2PasswordBearer):
             logger.warning("Failed to decode JWT: `%s`", token)
             raise UnauthorizedException from None
 
-    async def _payload_to_user(self, payload: dict[str, Any]) -> User:
+    async def _payload_to_user(
+        self, payload: dict[str, Any], token: "str | None" = None
+    ) -> User:
         user_id = payload.get("sub")
 
         if user_id is None:
             logger.warning("Failed to get user id")
             raise UnauthorizedException
 
+        if token is not None and self.redis is not None:
+            user_data = await self._verify_token(user_id, token, payload.get("iat", 0))
+        elif self.user_cache is not None:
+            user_data = await self.user_cache.get(user_id)
+        else:
+            user_data = MISSING
+
+        if user_data is not MISSING:
+            return User(**user_data)
+
         user = await self._load_user(user_id)
 
         if user is None:
             logger.warning("Failed to get user")
             raise UnauthorizedException
 
+        await self._cache_user(user_id, user)
+
         return user
 
     def create_access_token(
@@ -85,9 +190,14 @@ class LoginManager(OAuth2PasswordBearer):
     ) -> str:
         expiry = expiry or self.default_expiry
 
+        now = datetime.now(tz=UTC)
         payload = {
             "sub": user_id,
-            "exp": (datetime.now(tz=UTC) + expiry),
+            # Fractional, so tokens issued right after a logout stay valid
+            "iat": now.timestamp(),
+            "exp": (now + expiry),
+            # Tokens issued within the same second must differ
+            "jti": secrets.token_urlsafe(8),
         }
 
         token = jwt.encode(payload, key=self.secret, algorithm=self.algorithm)
@@ -95,9 +205,21 @@ class LoginManager(OAuth2PasswordBearer):
 
         return token
 
+    async def revoke_access_tokens(self, user_id: str) -> None:
+        """Revoke every token of the user, issued so far."""
+        if self.redis is not None:
+            # Older tokens expire by themselves, so the record isn't needed
+            await self.redis.set(
+                self._revoked_key(user_id),
+                datetime.now(tz=UTC).timestamp(),
+                ex=self.default_expiry,
+            )
+
+        await self.invalidate_user(user_id)
+
     async def get_current_user(self, token: str) -> Any:  # noqa: ANN401
         payload = await self._token_to_payload(token)
-        return await self._payload_to_user(payload)
+        return await self._payload_to_user(payload, token)
 
     def user_getter(self, func: Callable[[str], Any]) -> Callable[[str], Any]:
         self.user_getter_func = func
@@ -113,19 +235,30 @@ class LoginManager(OAuth2PasswordBearer):
         token = await self._request_to_token(request)
         payload = await self._token_to_payload(token)
 
-        return await self._payload_to_user(payload)
+        return await self._payload_to_user(payload, token)
 
 
 SECRET_KEY = os.environ["AUTH_SECRET"]
 
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "1024"))
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "60"))  # seconds
+USER_CACHE_REDIS = os.getenv("USER_CACHE_REDIS", "true").lower() in {"1", "true"}
+
 login_manager = LoginManager(
     token_url="/auth/login",  # noqa: S106
     secret=SECRET_KEY,
     default_expiry=timedelta(days=7),
+    user_cache=TwoTierCache(
+        async_redis_session if USER_CACHE_REDIS else None,
+        "user:",
+        USER_CACHE_SIZE,
+    ),
+    user_cache_ttl=USER_CACHE_TTL,
+    redis=async_redis_session,
 )
 
 
 @login_manager.user_getter
-def load_user(user_id: str) -> "User | None":
-    with next(get_session()) as session:
-        return session.exec(select(User).where(User.login == user_id)).first()
+async def load_user(user_id: str) -> "User | None":
+    async with async_session_maker() as session:
+        return (await session.exec(select(User).where(User.login == user_id))).first()
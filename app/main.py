@@ -1,29 +1,54 @@
 import os
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 
+from app.integrations import gemini
+from app.integrations.kinopoisk import genres_catalogue, kinopoisk
 from app.models import MessageResponse
 from app.routers import (
     auth,
     films,
+    internal,
     profile,
     sessions,
     watched_managment,
     watchlist_management,
 )
-from app.services.postgres import create_db_and_tables
+from app.services.passwords import password_hasher
+from app.services.postgres import async_engine, create_db_and_tables
+from app.services.redis import async_redis_session
 
 # Initiate Postgres
 create_db_and_tables()
 
+
+@asynccontextmanager
+async def lifespan(_: FastAPI) -> AsyncIterator[None]:
+    genres_catalogue.start()
+
+    yield
+
+    await genres_catalogue.stop()
+
+    # Release pooled connections to integrations
+    await kinopoisk.close()
+    await gemini.client.close()
+    await async_redis_session.aclose()
+    await async_engine.dispose()
+    password_hasher.shutdown()
+
+
 # Initiate FastAPI
-app = FastAPI(title="Supernova")
+app = FastAPI(title="Supernova", lifespan=lifespan)
 app.include_router(auth.router)
 app.include_router(watchlist_management.router)
 app.include_router(films.router)
 app.include_router(watched_managment.router)
 app.include_router(sessions.router)
 app.include_router(profile.router)
+app.include_router(internal.router)
 
 
 @app.get("/")
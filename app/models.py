@@ -2,12 +2,25 @@ from __future__ import annotations
 
 import datetime
 
-from passlib.context import CryptContext
-from sqlalchemy import String
+from sqlalchemy import Index, String, func, text, tuple_
 from sqlalchemy.dialects.postgresql import ARRAY
-from sqlmodel import Field, Session, SQLModel, select
+from sqlmodel import Field, SQLModel, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from app.services.passwords import password_hasher
+
+# Films with ids above are ones, which were added by users themselves
+USER_FILM_ID_START = 500_000_000
+
+
+# Catalogue is searched in both languages
+SEARCH_CONFIGS = ("russian", "english")
+FILM_SEARCH_DOCUMENT = "coalesce(title, '') || ' ' || coalesce(description, '')"
+
+
+def film_search_vector(config: str) -> str:
+    # Queries must use the same expression, for indexes to be used
+    return f"to_tsvector('{config}'::regconfig, {FILM_SEARCH_DOCUMENT})"
 
 
 def now() -> int:
@@ -20,14 +33,50 @@ class User(SQLModel, table=True):
     login: str = Field(index=True, unique=True)
     hashed_password: str | None = None
 
-    def verify_password(self, password: str) -> bool:
-        return pwd_context.verify(password, self.hashed_password)
+    async def verify_password_async(self, password: str) -> bool:
+        if self.hashed_password is None:
+            return False
+
+        is_valid, new_hash = await password_hasher.verify_and_update(
+            password, self.hashed_password
+        )
+
+        # Hash was made with outdated settings
+        if is_valid and new_hash is not None:
+            self.hashed_password = new_hash
 
-    def set_password(self, password: str) -> None:
-        self.hashed_password = pwd_context.hash(password)
+        return is_valid
+
+    async def set_password_async(self, password: str) -> None:
+        self.hashed_password = await password_hasher.hash(password)
 
 
 class Film(SQLModel, table=True):
+    __table_args__ = (
+        # Genre filters, `genres && ...`
+        Index("ix_film_genres", "genres", postgresql_using="gin"),
+        # Top rated films, also of genres, when the genre is common enough
+        Index(
+            "ix_film_rating",
+            text("rating DESC NULLS LAST"),
+        ),
+        # Substring and fuzzy matching of titles
+        Index(
+            "ix_film_title_trgm",
+            "title",
+            postgresql_using="gin",
+            postgresql_ops={"title": "gin_trgm_ops"},
+        ),
+        *(
+            Index(
+                f"ix_film_search_{config}",
+                text(film_search_vector(config)),
+                postgresql_using="gin",
+            )
+            for config in SEARCH_CONFIGS
+        ),
+    )
+
     id: int = Field(primary_key=True)
 
     # Mandatory
@@ -83,13 +132,37 @@ class FilmReturn(SQLModel, table=False):
     is_watchlisted: bool | None = False
 
 
-class Profile(SQLModel, table=False):
+class FilmSuggestion(SQLModel, table=False):
+    id: int
+    title: str
+    year: int | None = None
+
+
+class ProfileSummary(SQLModel, table=False):
     username: str
     watched_count: int
     watchlist_count: int
+
+
+class Profile(ProfileSummary, table=False):
+    # Most recently watched films only
     watched_films: list[Film]
 
 
+class PoolStats(SQLModel, table=False):
+    size: int
+    checked_in: int
+    checked_out: int
+    overflow: int
+    max_overflow: int
+
+    # Checkouts which found no idle connection, time in seconds
+    waits: int
+    wait_time_total: float
+    wait_time_max: float
+    timeouts: int
+
+
 class MessageResponse(SQLModel, table=False):
     message: str
 
@@ -107,6 +180,11 @@ class Image(SQLModel, table=False):
 
 
 class FilmWatchlist(SQLModel, table=True):
+    # Pages of the list, most recently added first
+    __table_args__ = (
+        Index("ix_filmwatchlist_user_added", "user_id", "added", "film_id"),
+    )
+
     user_id: str = Field(primary_key=True, foreign_key="user.login")
     film_id: int = Field(primary_key=True, foreign_key="film.id")
 
@@ -114,23 +192,81 @@ class FilmWatchlist(SQLModel, table=True):
 
 
 class FilmWatched(SQLModel, table=True):
+    # Pages of the list, most recently added first
+    __table_args__ = (
+        Index("ix_filmwatched_user_added", "user_id", "added", "film_id"),
+    )
+
     user_id: str = Field(primary_key=True, foreign_key="user.login")
     film_id: int = Field(primary_key=True, foreign_key="film.id")
 
     added: datetime.datetime = Field(default_factory=datetime.datetime.now)
 
 
-def get_watched_ids(session: Session, user: User) -> list[int]:
-    return list(
-        session.exec(
-            select(FilmWatched.film_id).where(FilmWatched.user_id == user.login)
-        ).all()
+async def get_watchlisted_ids(session: AsyncSession, user: User) -> list[int]:
+    result = await session.exec(
+        select(FilmWatchlist.film_id).where(FilmWatchlist.user_id == user.login)
     )
-
-
-def get_watchlisted_ids(session: Session, user: User) -> list[int]:
-    return list(
-        session.exec(
-            select(FilmWatchlist.film_id).where(FilmWatchlist.user_id == user.login)
-        ).all()
+    return list(result.all())
+
+
+async def get_user_films(
+    session: AsyncSession,
+    record: type[FilmWatchlist | FilmWatched],
+    user: User,
+    limit: int,
+    after: tuple[datetime.datetime, int] | None = None,
+) -> list[tuple[Film, datetime.datetime]]:
+    """Films from the list of the user, most recently added first.
+
+    Returns films with the time they were added, the page starts right after
+    `after` pair of the time and film id.
+    """
+    query = (
+        select(Film, record.added)
+        .join(record, record.film_id == Film.id)  # type: ignore
+        .where(record.user_id == user.login)
+    )
+    if after is not None:
+        query = query.where(tuple_(record.added, record.film_id) < tuple_(*after))
+
+    query = query.order_by(
+        record.added.desc(),  # type: ignore
+        record.film_id.desc(),  # type: ignore
+    ).limit(limit)
+
+    return list((await session.exec(query)).all())
+
+
+async def get_session_candidates(
+    session: AsyncSession,
+    user: User,
+    user_target: User,
+    genres: list[str],
+    limit: int,
+) -> list[Film]:
+    """Films from watchlists of both users, which have any of the genres.
+
+    Films common for both users go first, then ones with higher rating.
+    """
+    watchers = func.count(FilmWatchlist.user_id)
+
+    result = await session.exec(
+        select(Film)
+        .join(FilmWatchlist, FilmWatchlist.film_id == Film.id)  # type: ignore
+        .where(
+            FilmWatchlist.user_id.in_([user.login, user_target.login]),  # type: ignore
+            Film.genres.overlap(genres),  # type: ignore
+            Film.title != "",
+            Film.image_url != "",
+            Film.id < USER_FILM_ID_START,
+        )
+        .group_by(Film.id)  # type: ignore
+        .order_by(
+            watchers.desc(),
+            Film.rating.desc().nulls_last(),  # type: ignore
+            Film.id,
+        )
+        .limit(limit)
     )
+    return list(result.all())
@@ -0,0 +1,74 @@
+"""Keyset pagination of list endpoints.
+
+Cursor is the opaque sort key of the last item on the page, the next page
+starts right after it. Cursor of the next page is returned in the
+`X-Next-Cursor` header, so bodies of the endpoints stay lists.
+"""
+
+import base64
+import binascii
+import json
+import os
+from collections.abc import Callable
+from datetime import datetime
+from typing import Annotated, Any, TypeVar
+
+from fastapi import HTTPException, Query, Response
+
+T = TypeVar("T")
+
+DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE", "50"))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "200"))
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+Cursor = Annotated[str | None, Query()]
+PageSize = Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)]
+
+
+def _to_json(value: Any) -> str:  # noqa: ANN401
+    if isinstance(value, datetime):
+        return value.isoformat()
+
+    msg = f"Can't put {type(value).__name__} in cursor"
+    raise TypeError(msg)
+
+
+def encode_cursor(*values: Any) -> str:  # noqa: ANN401
+    data = json.dumps(values, default=_to_json, separators=(",", ":"))
+    return base64.urlsafe_b64encode(data.encode()).decode()
+
+
+def decode_cursor(cursor: str, *parsers: Callable[[Any], Any]) -> tuple[Any, ...]:
+    """Parse values of the cursor, `None` values are kept as they are."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+
+        if not isinstance(values, list) or len(values) != len(parsers):
+            raise ValueError
+
+        return tuple(
+            None if value is None else parse(value)
+            for parse, value in zip(parsers, values, strict=True)
+        )
+    except (ValueError, TypeError, binascii.Error) as e:
+        raise HTTPException(status_code=400, detail="Invalid cursor") from e
+
+
+def paginate(
+    items: list[T], limit: int, key: Callable[[T], tuple[Any, ...]]
+) -> tuple[list[T], str | None]:
+    """Page and cursor of the next one, `items` must have one extra item.
+
+    The extra item tells whether there is the next page at all.
+    """
+    if len(items) <= limit:
+        return items, None
+
+    page = items[:limit]
+    return page, encode_cursor(*key(page[-1]))
+
+
+def set_next_cursor(response: Response, cursor: str | None) -> None:
+    if cursor is not None:
+        response.headers[NEXT_CURSOR_HEADER] = cursor
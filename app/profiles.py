@@ -0,0 +1,95 @@
+"""User profiles, cached in Redis until the user changes their lists."""
+
+import os
+
+from sqlalchemy import ScalarSelect, literal, true
+from sqlalchemy.orm import aliased
+from sqlmodel import func, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.models import Film, FilmWatched, FilmWatchlist, Profile, ProfileSummary, User
+from app.services.cache import MISSING, TwoTierCache
+from app.services.redis import async_redis_session
+
+# Full history is paginated by `/watched`
+PROFILE_WATCHED_FILMS = int(os.getenv("PROFILE_WATCHED_FILMS", "20"))
+
+PROFILE_CACHE_TTL = int(os.getenv("PROFILE_CACHE_TTL", "300"))  # seconds
+# In-memory tier is off by default, as other instances can't invalidate it
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "0"))
+
+profile_cache = TwoTierCache(async_redis_session, "profile:", PROFILE_CACHE_SIZE)
+
+
+def _count(record: type[FilmWatchlist | FilmWatched], user: User) -> ScalarSelect:
+    return (
+        select(func.count())
+        .select_from(record)
+        .where(record.user_id == user.login)
+        .scalar_subquery()
+    )
+
+
+async def load_profile_summary(session: AsyncSession, user: User) -> ProfileSummary:
+    """Counts of the user's films, without loading any of them."""
+    result = await session.exec(
+        select(_count(FilmWatched, user), _count(FilmWatchlist, user))
+    )
+    watched_count, watchlist_count = result.one()
+
+    return ProfileSummary(
+        username=user.login,
+        watched_count=watched_count,
+        watchlist_count=watchlist_count,
+    )
+
+
+async def load_profile(session: AsyncSession, user: User) -> Profile:
+    """Counts and recently watched films of the user, in a single query."""
+    watched_count = _count(FilmWatched, user)
+    watchlist_count = _count(FilmWatchlist, user)
+    recent = (
+        select(Film, FilmWatched.added)
+        .join(FilmWatched, FilmWatched.film_id == Film.id)  # type: ignore
+        .where(FilmWatched.user_id == user.login)
+        .order_by(
+            FilmWatched.added.desc(),  # type: ignore
+            FilmWatched.film_id.desc(),  # type: ignore
+        )
+        .limit(PROFILE_WATCHED_FILMS)
+        .subquery()
+    )
+    recent_film = aliased(Film, recent)
+
+    # Counts are returned even if nothing was watched yet
+    row = select(literal(1)).subquery()
+    result = await session.exec(
+        select(watched_count, watchlist_count, recent_film)
+        .select_from(row)
+        .outerjoin(recent, true())
+        .order_by(recent.c.added.desc(), recent.c.id.desc())
+    )
+    rows = result.all()
+
+    return Profile(
+        username=user.login,
+        watched_count=rows[0][0],
+        watchlist_count=rows[0][1],
+        watched_films=[film for _, _, film in rows if film is not None],
+    )
+
+
+async def get_profile(session: AsyncSession, user: User) -> Profile:
+    profile_data = await profile_cache.get(user.login)
+
+    if profile_data is not MISSING:
+        return Profile.model_validate(profile_data)
+
+    profile = await load_profile(session, user)
+    await profile_cache.set(user.login, profile.model_dump(), PROFILE_CACHE_TTL)
+
+    return profile
+
+
+async def invalidate_profile(user: User) -> None:
+    await profile_cache.delete(user.login)
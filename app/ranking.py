@@ -0,0 +1,36 @@
+"""Ranking of watch-together session candidates from Kinopoisk.
+
+Pure functions over already loaded films, so they can be benchmarked and
+tested without the database or Kinopoisk. Candidates from watchlists are
+ranked by Postgres, see `get_session_candidates`.
+"""
+
+from collections.abc import Iterable
+
+from app.models import Film
+
+
+def count_weight(film: Film, genres: set[str]) -> float:
+    matched = sum(genre in genres for genre in film.genres)
+    return matched / len(genres) * 0.6 + (film.rating or 0) / 10 * 0.4
+
+
+def is_presentable(film: Film) -> bool:
+    return bool(film.title and film.image_url)
+
+
+def rank_fallback(
+    films_by_genre: Iterable[Iterable[Film]], taken: list[Film], genres: list[str]
+) -> list[Film]:
+    """Films of requested genres, which are not taken yet, best matching first."""
+    wanted = set(genres)
+    titles = {film.title for film in taken}
+
+    candidates = []
+    for films in films_by_genre:
+        for film in films:
+            if is_presentable(film) and film.title not in titles:
+                titles.add(film.title)
+                candidates.append(film)
+
+    return sorted(candidates, key=lambda film: count_weight(film, wanted), reverse=True)
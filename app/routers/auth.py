@@ -3,63 +3,64 @@ from __future__ import annotations
 from typing import Annotated
 
 from fastapi import APIRouter, Depends, Form, HTTPException
-from sqlmodel import Session, select
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app.login_manager import login_manager
 from app.models import MessageResponse, Token, User, UserPing
-from app.services.postgres import get_session
-from app.services.redis import redis_session
+from app.services.postgres import get_async_session
+from app.services.rate_limit import login_rate_limiter, register_rate_limiter
 
 router = APIRouter(tags=["auth"], prefix="/auth")
 
 
-@router.post("/login")
+@router.post("/login", dependencies=[Depends(login_rate_limiter)])
 async def login(
     username: Annotated[str, Form()],
     password: Annotated[str, Form()],
-    session: Annotated[Session, Depends(get_session)],
+    session: Annotated[AsyncSession, Depends(get_async_session)],
 ) -> Token:
     # Verify user credentials
-    user = session.exec(select(User).where(User.login == username)).first()
+    user = (await session.exec(select(User).where(User.login == username))).first()
+
+    if user and await user.verify_password_async(password):
+        # Password hash was upgraded
+        if session.is_modified(user):
+            await session.commit()
 
-    if user and user.verify_password(password):
         # Generate JWT token
         access_token = login_manager.create_access_token(user.login)
 
-        # Store the token in Redis
-        redis_session.set(f"access_token:{user.login}", access_token)
-
         # Return the access token
         return Token(access_token=access_token)
 
     raise HTTPException(status_code=401, detail="Unauthorized")
 
 
-@router.post("/register")
+@router.post("/register", dependencies=[Depends(register_rate_limiter)])
 async def register(
     username: Annotated[str, Form()],
     password: Annotated[str, Form()],
-    session: Annotated[Session, Depends(get_session)],
+    session: Annotated[AsyncSession, Depends(get_async_session)],
 ) -> Token:
     # Check if the user already exists
-    existing_user = session.exec(select(User).where(User.login == username)).first()
+    existing_user = (
+        await session.exec(select(User).where(User.login == username))
+    ).first()
 
     if existing_user:
         raise HTTPException(status_code=401, detail="Login already registered")
 
     # Register the new user
     user = User(login=username)
-    user.set_password(password)
+    await user.set_password_async(password)
 
     session.add(user)
-    session.commit()
+    await session.commit()
 
-    # Return success status
+    # Generate JWT token
     access_token = login_manager.create_access_token(user.login)
 
-    # Store the token in Redis
-    redis_session.set(f"access_token:{user.login}", access_token)
-
     # Return the access token
     return Token(access_token=access_token)
 
@@ -67,9 +68,12 @@ async def register(
 @router.post("/logout/{login}")
 async def logout(
     login: str,
-    user: Annotated[User, Depends(login_manager)],  # noqa: ARG001
+    user: Annotated[User, Depends(login_manager)],
 ) -> MessageResponse:
-    redis_session.delete(f"access_token:{login}")
+    if login != user.login:
+        raise HTTPException(status_code=403, detail="Can't log out another user")
+
+    await login_manager.revoke_access_tokens(user.login)
     return MessageResponse(message="Logged out")
 
 
@@ -1,5 +1,8 @@
 from __future__ import annotations
 
+import json
+import logging
+from collections.abc import AsyncIterator
 from typing import Annotated
 
 from fastapi import (
@@ -8,21 +11,43 @@ from fastapi import (
     HTTPException,
     Query,
     Request,
+    Response,
     UploadFile,
 )
-from sqlmodel import Session, select
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from starlette import status
 
-from app.integrations.gemini import get_discussions
+from app.integrations.gemini import get_discussions, stream_discussions
 from app.integrations.kinopoisk import (
     get_film_by_id,
     get_films_by_genres_and_keywords,
     get_genre_ids,
 )
 from app.login_manager import login_manager
-from app.models import Film, FilmReturn, Image, User, get_watchlisted_ids
+from app.models import (
+    Film,
+    FilmReturn,
+    FilmSuggestion,
+    Image,
+    User,
+    get_watchlisted_ids,
+)
+from app.pagination import Cursor, PageSize, decode_cursor, paginate, set_next_cursor
+from app.search import (
+    FILMS_SEARCH_LIMIT,
+    complete_film,
+    list_films,
+    search_films,
+    store_films,
+    suggest_films,
+)
 from app.services.minio import add_image
-from app.services.postgres import get_session
+from app.services.postgres import get_async_session
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(tags=["films"], prefix="/films")
 
@@ -38,76 +63,136 @@ async def upload_film_image(
 ) -> Image:
     base_url = str(request.base_url)
 
-    image_url = add_image(file, base_url)
+    image_url = await run_in_threadpool(add_image, file, base_url)
     return Image(image_url=image_url)
 
 
+async def get_discussed_film(session: AsyncSession, film_id: int) -> tuple[str, int]:
+    film = await session.get(Film, film_id)
+
+    if film is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+
+    film_name = film.title
+    film_year = film.year
+
+    if film_year is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST)
+
+    return film_name, film_year
+
+
+async def themes_to_events(themes: AsyncIterator[str]) -> AsyncIterator[str]:
+    try:
+        async for theme in themes:
+            yield f"data: {json.dumps(theme, ensure_ascii=False)}\n\n"
+
+    except Exception:
+        logger.exception("Failed to stream discussions")
+        yield f"event: error\ndata: {json.dumps('OpenAI API error')}\n\n"
+
+    yield "event: end\ndata: \n\n"
+
+
+def stream_themes(film_name: str, year: int) -> StreamingResponse:
+    return StreamingResponse(
+        themes_to_events(stream_discussions(film_name, year)),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            # Otherwise nginx would buffer the whole stream
+            "X-Accel-Buffering": "no",
+        },
+    )
+
+
 @router.get("/discuss/{film_name}/{year}")
 async def get_themes_for_discussion(
     user: Annotated[User, Depends(login_manager)],  # noqa: ARG001
     film_name: str,
     year: int,
 ) -> list[str]:
-    return get_discussions(film_name, year)
+    return await get_discussions(film_name, year)
 
 
 @router.get("/discuss-id/{film_id}")
 async def get_themes_for_discussion_by_id(
     film_id: int,
     user: Annotated[User, Depends(login_manager)],  # noqa: ARG001
-    session: Annotated[Session, Depends(get_session)],
+    session: Annotated[AsyncSession, Depends(get_async_session)],
 ) -> list[str]:
-    film = session.get(Film, film_id)
+    film_name, film_year = await get_discussed_film(session, film_id)
 
-    if film is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    return await get_discussions(film_name, film_year)
 
-    film_name = film.title
-    film_year = film.year
 
-    if film_year is None:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST)
+@router.get("/discuss-stream/{film_name}/{year}", response_class=StreamingResponse)
+async def stream_themes_for_discussion(
+    user: Annotated[User, Depends(login_manager)],  # noqa: ARG001
+    film_name: str,
+    year: int,
+) -> StreamingResponse:
+    return stream_themes(film_name, year)
 
-    return get_discussions(film_name, film_year)
+
+@router.get("/discuss-id-stream/{film_id}", response_class=StreamingResponse)
+async def stream_themes_for_discussion_by_id(
+    film_id: int,
+    user: Annotated[User, Depends(login_manager)],  # noqa: ARG001
+    session: Annotated[AsyncSession, Depends(get_async_session)],
+) -> StreamingResponse:
+    film_name, film_year = await get_discussed_film(session, film_id)
+
+    return stream_themes(film_name, film_year)
 
 
 @router.get("/")
 async def get_films(
-    session: Annotated[Session, Depends(get_session)],
+    session: Annotated[AsyncSession, Depends(get_async_session)],
     user: Annotated[User, Depends(login_manager)],
+    response: Response,
     search: Annotated[str | None, Query()] = None,
     genres: Annotated[list[str] | None, Query()] = None,
+    cursor: Cursor = None,
+    limit: PageSize = FILMS_SEARCH_LIMIT,
 ) -> list[FilmReturn]:
-    query = select(Film)
+    """Page of films, cursor of the next one is in `X-Next-Cursor`."""
+    genres = genres or []
+    after = decode_cursor(cursor, float, int) if cursor else None
 
     if search:
-        search = f"%{search.lower()}%"
-        query = query.where(
-            (Film.title.ilike(search)),  # type: ignore
-        )
+        rows = await search_films(session, search, genres, limit + 1, after)
     else:
-        search = ""
-    if genres and len(genres) > 0:
-        query = query.where(Film.genres.overlap(genres))  # type: ignore (works)
-    else:
-        genres = []
-
-    films = list(session.exec(query).all())
-    # Find genre IDs
-    genre_ids = await get_genre_ids(genres)
-    # Request to Kinopoisk API to get films by genres
-    films_kinopoisk = await get_films_by_genres_and_keywords(genre_ids, search)
-    films_kinopoisk = [
-        film
-        for film in films_kinopoisk
-        if film not in films and film.title and film.image_url
-    ]
-    if not films_kinopoisk:
+        rows = await list_films(session, genres, limit + 1, after)
+
+    page, next_cursor = paginate(rows, limit, lambda row: (row[1], row[0].id))
+    set_next_cursor(response, next_cursor)
+    films = [film for film, _ in page]
+
+    # Kinopoisk is only asked to fill the first page, as the catalogue is
+    # exhausted once the page isn't full
+    if cursor is None and len(films) < limit:
+        known_ids = {film.id for film in films}
         films_kinopoisk = []
 
-    watchlist = get_watchlisted_ids(session, user)
+        try:
+            genre_ids = await get_genre_ids(genres)
+            found = await get_films_by_genres_and_keywords(genre_ids, search or "")
+        except Exception:
+            # Local films are still worth returning
+            logger.exception("Failed to search films on Kinopoisk")
+            found = []
+
+        for film in found:
+            if film.id not in known_ids and film.title and film.image_url:
+                known_ids.add(film.id)
+                films_kinopoisk.append(film)
+
+        await store_films(session, films_kinopoisk)
+        films.extend(films_kinopoisk[: limit - len(films)])
+
+    watchlist = set(await get_watchlisted_ids(session, user))
 
-    films.extend(films_kinopoisk)
     return [
         FilmReturn(
             id=film.id,
@@ -118,27 +203,45 @@ async def get_films(
             year=film.year,
             rating=film.rating,
             film_url=film.film_url,
-            is_watchlisted=bool(film.id in watchlist),
+            is_watchlisted=film.id in watchlist,
         )
         for film in films
-        if film.id < 500_000_000
     ]
 
 
+@router.get("/suggest")
+async def suggest_films_by_title(
+    session: Annotated[AsyncSession, Depends(get_async_session)],
+    user: Annotated[User, Depends(login_manager)],  # noqa: ARG001
+    search: Annotated[str, Query(min_length=1)],
+    limit: Annotated[int, Query(ge=1, le=20)] = 10,
+) -> list[FilmSuggestion]:
+    films = await suggest_films(session, search, limit)
+
+    return [
+        FilmSuggestion(id=film.id, title=film.title, year=film.year) for film in films
+    ]
+
+
+# Must be the last, so it doesn't capture other routes
 @router.get("/{film_id}")
 async def get_film(
     film_id: int,
-    session: Annotated[Session, Depends(get_session)],
+    session: Annotated[AsyncSession, Depends(get_async_session)],
     user: Annotated[User, Depends(login_manager)],
 ) -> FilmReturn:
-    film = session.exec(select(Film).where(Film.id == film_id)).first()
+    film = (await session.exec(select(Film).where(Film.id == film_id))).first()
 
     if not film:
         film = await get_film_by_id(film_id)
         if not film:
             raise HTTPException(status_code=404, detail="Film not found")
 
-    watchlist = get_watchlisted_ids(session, user)
+        await store_films(session, [film])
+    else:
+        await complete_film(session, film)
+
+    watchlist = await get_watchlisted_ids(session, user)
 
     film_discussed = FilmReturn(
         id=film.id,
@@ -0,0 +1,12 @@
+from fastapi import APIRouter
+
+from app.models import PoolStats
+from app.services.postgres import get_pool_stats
+
+# Not proxied by nginx, available only from inside the deployment
+router = APIRouter(tags=["internal"], prefix="/internal", include_in_schema=False)
+
+
+@router.get("/metrics/db")
+async def get_db_metrics() -> PoolStats:
+    return PoolStats(**get_pool_stats())
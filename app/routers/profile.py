@@ -1,18 +1,12 @@
 from typing import Annotated
 
 from fastapi import APIRouter, Depends
-from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
+from app import profiles
 from app.login_manager import login_manager
-from app.models import (
-    Film,
-    FilmWatched,
-    Profile,
-    User,
-    get_watched_ids,
-    get_watchlisted_ids,
-)
-from app.services.postgres import get_session
+from app.models import Profile, ProfileSummary, User
+from app.services.postgres import get_async_session
 
 router = APIRouter(tags=["profile"], prefix="/profile")
 
@@ -20,23 +14,14 @@ router = APIRouter(tags=["profile"], prefix="/profile")
 @router.get("/")
 async def get_profile(
     user: Annotated[User, Depends(login_manager)],
-    session: Annotated[Session, Depends(get_session)],
+    session: Annotated[AsyncSession, Depends(get_async_session)],
 ) -> Profile:
-    watched_films = list(
-        session.exec(
-            select(Film)
-            .join(FilmWatched)
-            .where(FilmWatched.user_id == user.login)
-            .order_by(FilmWatched.added.desc())  # type: ignore
-        ).all()
-    )
+    return await profiles.get_profile(session, user)
 
-    watched_films_id = get_watched_ids(session, user)
-    to_watch_films_id = get_watchlisted_ids(session, user)
 
-    return Profile(
-        username=user.login,
-        watched_count=len(watched_films_id),
-        watchlist_count=len(to_watch_films_id),
-        watched_films=watched_films,
-    )
+@router.get("/summary")
+async def get_profile_summary(
+    user: Annotated[User, Depends(login_manager)],
+    session: Annotated[AsyncSession, Depends(get_async_session)],
+) -> ProfileSummary:
+    return await profiles.load_profile_summary(session, user)
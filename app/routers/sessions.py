@@ -1,42 +1,109 @@
+import asyncio
 import base64
 import logging
+import os
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlmodel import Session, select
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app.integrations.kinopoisk import get_films_by_genres_and_keywords, get_genre_ids
 from app.login_manager import login_manager
-from app.models import Film, Genres, MessageResponse, User, get_watchlisted_ids
+from app.models import (
+    Film,
+    Genres,
+    MessageResponse,
+    User,
+    get_session_candidates,
+    get_watchlisted_ids,
+)
+from app.pagination import set_next_cursor
+from app.ranking import rank_fallback
 from app.routers.films import FilmReturn
-from app.services.postgres import get_session
-from app.services.redis import redis_session
+from app.services.postgres import get_async_session
+from app.services.watch_sessions import WatchSessions, get_watch_sessions
 
 router = APIRouter(tags=["session"], prefix="/session")
 
 
 FILMS_PER_SESSION = 10
 
+# Ranked candidates kept for the whole session
+SESSION_DECK_SIZE = int(os.getenv("SESSION_DECK_SIZE", "100"))
+
+# Kinopoisk fan-out when watchlists don't have enough films
+GENRES_FETCH_CONCURRENCY = int(os.getenv("SESSION_GENRES_FETCH_CONCURRENCY", "5"))
+GENRE_FETCH_TIMEOUT = float(os.getenv("SESSION_GENRE_FETCH_TIMEOUT", "3"))  # seconds
+
 logger = logging.getLogger(__name__)
 
 
-def count_weight(film: Film, genres: list[str]) -> float:
-    film_genres = [genre for genre in film.genres if genre in genres]
-    return len(film_genres) / len(genres) * 0.6 + (film.rating or 0) / 10 * 0.4
+def to_card(film: Film) -> str:
+    # Watchlist state differs between the users, so it's not stored
+    return FilmReturn(**film.model_dump()).model_dump_json(exclude={"is_watchlisted"})
+
+
+def from_cards(
+    cards: list[str] | list[bytes], watchlisted_ids: set[int]
+) -> list[FilmReturn]:
+    films = [FilmReturn.model_validate_json(card) for card in cards]
+
+    for film in films:
+        film.is_watchlisted = film.id in watchlisted_ids
+
+    return films
+
+
+def next_offset(offset: int, page_size: int, limit: int) -> str | None:
+    """Deck is a fixed list, so its cursor is just an offset."""
+    return str(offset + limit) if page_size == limit else None
+
+
+async def get_films_by_genre(genre_ids: list[int]) -> list[list[Film]]:
+    """Fetch films for every genre concurrently, skipping failed or slow genres."""
+    semaphore = asyncio.Semaphore(GENRES_FETCH_CONCURRENCY)
+
+    async def fetch(genre_id: int) -> list[Film]:
+        async with semaphore:
+            return await asyncio.wait_for(
+                get_films_by_genres_and_keywords([genre_id], ""),
+                GENRE_FETCH_TIMEOUT,
+            )
+
+    results = await asyncio.gather(
+        *(fetch(genre_id) for genre_id in genre_ids),
+        return_exceptions=True,
+    )
+
+    films_by_genre = []
+    for genre_id, result in zip(genre_ids, results, strict=True):
+        if isinstance(result, Exception):
+            logger.warning("Failed to fetch films of genre %s: %r", genre_id, result)
+            continue
+
+        films_by_genre.append(result)
+
+    return films_by_genre
 
 
 @router.post("/create/{user_login}")
 async def create_session(
-    session: Annotated[Session, Depends(get_session)],
+    response: Response,
+    session: Annotated[AsyncSession, Depends(get_async_session)],
+    watch_sessions: Annotated[WatchSessions, Depends(get_watch_sessions)],
     user: Annotated[User, Depends(login_manager)],
     user_login: str,
     genres: Genres,
 ) -> list[FilmReturn]:
+    """Start the session, returning the first page of its deck."""
     logger.info(base64.b64encode(user_login.encode()).decode())
-    user_target = session.exec(
-        select(User).where(
-            User.login == user_login,
-        ),
+    user_target = (
+        await session.exec(
+            select(User).where(
+                User.login == user_login,
+            ),
+        )
     ).first()
     if user_target is None:
         raise HTTPException(status_code=404, detail="User not found")
@@ -47,106 +114,72 @@ async def create_session(
             detail="You can't create session with yourself",
         )
 
-    if redis_session.get(f"session:{user.login}") == "active":
+    # Create session
+    if not await watch_sessions.start(user.login, user_target.login):
         raise HTTPException(
             status_code=400,
             detail="Session already exists with this user",
         )
 
-    if redis_session.get(f"session:{user_target.login}") == "active":
-        raise HTTPException(
-            status_code=400,
-            detail="Session already exists with this user",
+    genres_list = genres.genres
+
+    try:
+        user_watchlist_ids = set(await get_watchlisted_ids(session, user))
+        res = await get_session_candidates(
+            session, user, user_target, genres_list, SESSION_DECK_SIZE
         )
 
-    # Create session
-    redis_session.set(f"session:{user_target.login}", "active")
-    redis_session.set(f"session:{user.login}", "active")
-    redis_session.set(f"session:{user.login}:{user_target.login}", "active")
+        if len(res) < FILMS_PER_SESSION:
+            genre_ids = await get_genre_ids(genres_list)
+            films_by_genre = await get_films_by_genre(genre_ids)
 
-    user_watchlist = get_watchlisted_ids(session, user)
-    user_target_watchlist = get_watchlisted_ids(session, user_target)
+            res.extend(rank_fallback(films_by_genre, res, genres_list))
 
-    user_watchlist = session.exec(select(Film).where(Film.id.in_(user_watchlist)))  # type: ignore
-    user_target_watchlist = session.exec(
-        select(Film).where(Film.id.in_(user_target_watchlist)),  # type: ignore
-    )
-    genres_list = genres.genres
+        # Rest of the deck is served by `/next`
+        deck = [to_card(film) for film in res[:SESSION_DECK_SIZE]]
+        await watch_sessions.save_deck(user.login, user_target.login, deck)
+    except Exception:
+        # Don't leave both users locked in a session without a deck
+        await watch_sessions.end(user.login, user_target.login)
+        raise
 
-    # find common films
-    user_watchlist = [
-        film
-        for film in user_watchlist
-        if any(genre in genres_list for genre in film.genres)
-    ]
-    user_target_watchlist = [
-        film
-        for film in user_target_watchlist
-        if any(genre in genres_list for genre in film.genres)
-    ]
-
-    res = []
-    res_end = []
-
-    for film in user_watchlist:
-        if film in user_target_watchlist:
-            res.append(film)
-        else:
-            res_end.append(film)
-
-    for film in user_target_watchlist:
-        if film not in res and film not in res_end:
-            res_end.append(film)
-    res.extend(res_end)
-    res = [
-        film for film in res if film.title and film.image_url and film.id < 500_000_000
-    ]
-
-    if len(res) < FILMS_PER_SESSION:
-        kinop_unsorted = []
-        genre_ids = await get_genre_ids(genres_list)
-
-        for id in genre_ids:
-            films = await get_films_by_genres_and_keywords([id], "")
-            films = [
-                film
-                for film in films
-                if film.title
-                and film.image_url
-                and film.title not in [i.title for i in res]
-                and film.title not in [i.title for i in kinop_unsorted]
-            ]
-            kinop_unsorted.extend(films)
-
-        kinop_weighted = [(i, count_weight(i, genres_list)) for i in kinop_unsorted]
-        kinop_weighted = sorted(kinop_weighted, key=lambda x: x[1], reverse=True)
-        kinop_weighted = [i[0] for i in kinop_weighted]
-
-        res.extend(kinop_weighted)
-
-    return [
-        FilmReturn(
-            id=film.id,
-            title=film.title,
-            description=film.description,
-            image_url=film.image_url,
-            genres=film.genres,
-            year=film.year,
-            rating=film.rating,
-            film_url=film.film_url,
-            is_watchlisted=bool(film.id in get_watchlisted_ids(session, user)),
-        )
-        for film in res[:10]
-    ]
+    page = deck[:FILMS_PER_SESSION]
+    set_next_cursor(response, next_offset(0, len(page), FILMS_PER_SESSION))
+
+    return from_cards(page, user_watchlist_ids)
+
+
+@router.get("/next/{user_login}")
+async def get_session_films(
+    user_login: str,
+    response: Response,
+    session: Annotated[AsyncSession, Depends(get_async_session)],
+    watch_sessions: Annotated[WatchSessions, Depends(get_watch_sessions)],
+    user: Annotated[User, Depends(login_manager)],
+    cursor: Annotated[int, Query(ge=0)] = FILMS_PER_SESSION,
+    limit: Annotated[int, Query(ge=1, le=SESSION_DECK_SIZE)] = FILMS_PER_SESSION,
+) -> list[FilmReturn]:
+    """Next page of the session deck, cursor is returned in `X-Next-Cursor`."""
+    page = await watch_sessions.get_deck(user.login, user_login, cursor, limit)
+
+    if page is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    set_next_cursor(response, next_offset(cursor, len(page), limit))
+
+    return from_cards(page, set(await get_watchlisted_ids(session, user)))
 
 
 @router.post("/end/{user_login}")
 async def end_session(
     user_login: str,
-    session: Annotated[Session, Depends(get_session)],
+    session: Annotated[AsyncSession, Depends(get_async_session)],
+    watch_sessions: Annotated[WatchSessions, Depends(get_watch_sessions)],
     user: Annotated[User, Depends(login_manager)],
 ) -> MessageResponse:
-    user_target = session.exec(select(User).where(User.login == user_login)).first()
+    user_target = (
+        await session.exec(select(User).where(User.login == user_login))
+    ).first()
 
     if user_target is None:
         raise HTTPException(status_code=404, detail="User not found")
@@ -156,8 +189,7 @@ async def end_session(
             status_code=400,
             detail="You can't end session with yourself",
         )
-    redis_session.set(f"session:{user_target.login}", "inactive")
-    redis_session.set(f"session:{user.login}", "inactive")
-    redis_session.set(f"session:{user.login}:{user_target.login}", "inactive")
+    # Ending is idempotent, whether the session was active or not
+    await watch_sessions.end(user.login, user_target.login)
 
     return MessageResponse(message="Session ended")
@@ -1,78 +1,106 @@
+from datetime import datetime
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, File, Form, Request, UploadFile
-from sqlmodel import Session, select
+from fastapi import APIRouter, Depends, File, Form, Request, Response, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app.integrations.kinopoisk import get_film_by_id
 from app.login_manager import login_manager
-from app.models import Film, FilmAdd, FilmWatched, FilmWatchlist, MessageResponse, User
+from app.models import (
+    Film,
+    FilmAdd,
+    FilmWatched,
+    FilmWatchlist,
+    MessageResponse,
+    User,
+    get_user_films,
+)
+from app.pagination import (
+    DEFAULT_PAGE_SIZE,
+    Cursor,
+    PageSize,
+    decode_cursor,
+    paginate,
+    set_next_cursor,
+)
+from app.profiles import invalidate_profile
+from app.search import complete_film
 from app.services.minio import add_image
-from app.services.postgres import get_session
+from app.services.postgres import get_async_session
 
 router = APIRouter(tags=["watched"], prefix="/watched")
 
 
 @router.get("/")
-def get_watched(
-    session: Annotated[Session, Depends(get_session)],
+async def get_watched(
+    response: Response,
+    session: Annotated[AsyncSession, Depends(get_async_session)],
     user: Annotated[User, Depends(login_manager)],
+    cursor: Cursor = None,
+    limit: PageSize = DEFAULT_PAGE_SIZE,
 ) -> list[Film]:
-    return list(
-        session.exec(
-            select(Film)
-            .join(FilmWatched)
-            .where(FilmWatched.user_id == user.login)
-            .order_by(FilmWatched.added.desc())  # type: ignore
-        ).all()
-    )
+    """Page of the list, cursor of the next one is in `X-Next-Cursor`."""
+    after = decode_cursor(cursor, datetime.fromisoformat, int) if cursor else None
+    films = await get_user_films(session, FilmWatched, user, limit + 1, after)
+
+    page, next_cursor = paginate(films, limit, lambda row: (row[1], row[0].id))
+    set_next_cursor(response, next_cursor)
+
+    return [film for film, _ in page]
 
 
 @router.post("/add")
 async def add_new_film_to_watched(
     film: FilmAdd,
-    session: Annotated[Session, Depends(get_session)],
+    session: Annotated[AsyncSession, Depends(get_async_session)],
     user: Annotated[User, Depends(login_manager)],
 ) -> MessageResponse:
     db_film = Film.model_validate_json(film.model_dump_json())
 
     session.add(db_film)
-    session.commit()
-    session.refresh(db_film)
+    await session.commit()
+    await session.refresh(db_film)
     db_film.id += 500_000_000
     session.add(db_film)
-    session.commit()
+    await session.commit()
 
     watched_record = FilmWatched(user_id=user.login, film_id=db_film.id)
     session.add(watched_record)
-    session.commit()
+    await session.commit()
+
+    await invalidate_profile(user)
 
     return MessageResponse(message="Film added to watched")
 
 
 @router.post("/add-with-image")
-def add_new_film_with_image_to_watched(
+async def add_new_film_with_image_to_watched(
     film: Annotated[str, Form()],
     file: Annotated[UploadFile, File()],
     request: Request,
-    session: Annotated[Session, Depends(get_session)],
+    session: Annotated[AsyncSession, Depends(get_async_session)],
     user: Annotated[User, Depends(login_manager)],
 ) -> MessageResponse:
     base_url = str(request.base_url)
-    image_url = add_image(file, base_url)
+    image_url = await run_in_threadpool(add_image, file, base_url)
 
     db_film = Film.model_validate_json(film)
     db_film.image_url = image_url
 
     session.add(db_film)
-    session.commit()
-    session.refresh(db_film)
+    await session.commit()
+    await session.refresh(db_film)
     db_film.id += 500_000_000
     session.add(db_film)
-    session.commit()
+    await session.commit()
 
     watched_record = FilmWatched(user_id=user.login, film_id=db_film.id)
     session.add(watched_record)
-    session.commit()
+    await session.commit()
+
+    await invalidate_profile(user)
 
     return MessageResponse(message="Film added to watched")
 
@@ -80,23 +108,27 @@ def add_new_film_with_image_to_watched(
 @router.post("/add/{film_id}")
 async def add_existing_film_to_watched(
     film_id: int,
-    session: Annotated[Session, Depends(get_session)],
+    session: Annotated[AsyncSession, Depends(get_async_session)],
     user: Annotated[User, Depends(login_manager)],
 ) -> MessageResponse:
-    film = session.exec(select(Film).where(Film.id == film_id)).first()
+    film = (await session.exec(select(Film).where(Film.id == film_id))).first()
 
     if film is None:
         session.add(await get_film_by_id(film_id))
-        session.commit()
+        await session.commit()
+    else:
+        await complete_film(session, film)
 
-    if film := session.get(FilmWatchlist, (user.login, film_id)):
-        session.delete(film)
-        session.commit()
+    if film := await session.get(FilmWatchlist, (user.login, film_id)):
+        await session.delete(film)
+        await session.commit()
 
     # As we dont have `ON CONFLICT`
-    if session.get(FilmWatched, (user.login, film_id)) is None:
+    if await session.get(FilmWatched, (user.login, film_id)) is None:
         watched_record = FilmWatched(user_id=user.login, film_id=film_id)
         session.add(watched_record)
-        session.commit()
+        await session.commit()
+
+    await invalidate_profile(user)
 
     return MessageResponse(message="Film added to watched")
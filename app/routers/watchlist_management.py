@@ -1,14 +1,35 @@
 import logging
+from datetime import datetime
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, File, Form, Request, UploadFile
-from sqlmodel import Session, select
+from fastapi import APIRouter, Depends, File, Form, Request, Response, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app.integrations.kinopoisk import get_film_by_id
 from app.login_manager import login_manager
-from app.models import Film, FilmAdd, FilmWatchlist, MessageResponse, User
+from app.models import (
+    Film,
+    FilmAdd,
+    FilmWatchlist,
+    MessageResponse,
+    User,
+    get_user_films,
+)
+from app.pagination import (
+    DEFAULT_PAGE_SIZE,
+    Cursor,
+    PageSize,
+    decode_cursor,
+    paginate,
+    set_next_cursor,
+)
+from app.profiles import invalidate_profile
+from app.search import complete_film
 from app.services.minio import add_image
-from app.services.postgres import get_session
+from app.services.postgres import get_async_session
+from app.workers.discussions import enqueue_discussions
 
 logger = logging.getLogger(__name__)
 
@@ -16,68 +37,75 @@ router = APIRouter(tags=["watchlist"], prefix="/watchlist")
 
 
 @router.get("/")
-def get_watchlist(
+async def get_watchlist(
+    response: Response,
     user: Annotated[User, Depends(login_manager)],
-    session: Annotated[Session, Depends(get_session)],
+    session: Annotated[AsyncSession, Depends(get_async_session)],
+    cursor: Cursor = None,
+    limit: PageSize = DEFAULT_PAGE_SIZE,
 ) -> list[Film]:
-    return list(
-        session.exec(
-            select(Film)
-            .join(FilmWatchlist)
-            .where(FilmWatchlist.user_id == user.login)
-            .order_by(FilmWatchlist.added.desc())  # type: ignore
-        ).all()
-    )
+    """Page of the list, cursor of the next one is in `X-Next-Cursor`."""
+    after = decode_cursor(cursor, datetime.fromisoformat, int) if cursor else None
+    films = await get_user_films(session, FilmWatchlist, user, limit + 1, after)
+
+    page, next_cursor = paginate(films, limit, lambda row: (row[1], row[0].id))
+    set_next_cursor(response, next_cursor)
+
+    return [film for film, _ in page]
 
 
 @router.post("/add")
 async def add_new_film_to_watchlist(
     film: FilmAdd,
-    session: Annotated[Session, Depends(get_session)],
+    session: Annotated[AsyncSession, Depends(get_async_session)],
     user: Annotated[User, Depends(login_manager)],
 ) -> MessageResponse:
     db_film = Film.model_validate_json(film.model_dump_json())
 
     session.add(db_film)
-    session.commit()
-    session.refresh(db_film)
+    await session.commit()
+    await session.refresh(db_film)
     db_film.id += 500_000_000
     session.add(db_film)
-    session.commit()
+    await session.commit()
 
     watchlist_record = FilmWatchlist(user_id=user.login, film_id=db_film.id)
     session.add(watchlist_record)
-    session.commit()
+    await session.commit()
+
+    await invalidate_profile(user)
 
     return MessageResponse(message="Film added to watchlist")
 
 
 @router.post("/add-with-image")
-def add_new_film_with_image_to_watchlist(
+async def add_new_film_with_image_to_watchlist(
     film: Annotated[str, Form()],
     file: Annotated[UploadFile, File()],
     request: Request,
-    session: Annotated[Session, Depends(get_session)],
+    session: Annotated[AsyncSession, Depends(get_async_session)],
     user: Annotated[User, Depends(login_manager)],
 ) -> MessageResponse:
     base_url = str(request.base_url)
-    image_url = add_image(file, base_url)
+    image_url = await run_in_threadpool(add_image, file, base_url)
 
     db_film = Film.model_validate_json(film)
     db_film.image_url = image_url
 
     session.add(db_film)
-    session.commit()
-    session.refresh(db_film)
+    await session.commit()
+    await session.refresh(db_film)
     db_film.id += 500_000_000
     session.add(db_film)
-    session.commit()
+    await session.commit()
 
     logger.info("Film id: %s", db_film.id)
 
     watchlist_record = FilmWatchlist(user_id=user.login, film_id=db_film.id)
     session.add(watchlist_record)
-    session.commit()
+    await session.commit()
+
+    await invalidate_profile(user)
 
     return MessageResponse(message="Film added to watchlist")
 
@@ -85,23 +113,30 @@ def add_new_film_with_image_to_watchlist(
 @router.post("/add/{film_id}")
 async def add_existing_film_to_watchlist(
     film_id: int,
-    session: Annotated[Session, Depends(get_session)],
+    session: Annotated[AsyncSession, Depends(get_async_session)],
     user: Annotated[User, Depends(login_manager)],
 ) -> MessageResponse:
-    film = session.exec(select(Film).where(Film.id == film_id)).first()
+    film = (await session.exec(select(Film).where(Film.id == film_id))).first()
 
     if film is None:
         logger.info("Film %s was not found in local database, seeking on kinopoisk")
         film = await get_film_by_id(film_id)
         logger.info("Added film %s to watchlist", film.id)
         session.add(film)
-        session.commit()
+        await session.commit()
+    else:
+        await complete_film(session, film)
 
     # As we dont have `ON CONFLICT`
-    if session.get(FilmWatchlist, (user.login, film_id)) is None:
+    if await session.get(FilmWatchlist, (user.login, film_id)) is None:
         watchlist_record = FilmWatchlist(user_id=user.login, film_id=film_id)
         session.add(watchlist_record)
-        session.commit()
+        await session.commit()
+
+    # Discussions are likely to be opened for the film later
+    await enqueue_discussions(film.title, film.year)
+
+    await invalidate_profile(user)
 
     return MessageResponse(message="Film added to watchlist")
 
@@ -109,15 +144,16 @@ async def add_existing_film_to_watchlist(
 @router.delete("/remove/{film_id}")
 async def remove_film_from_watchlist(
     film_id: int,
-    session: Annotated[Session, Depends(get_session)],
+    session: Annotated[AsyncSession, Depends(get_async_session)],
     user: Annotated[User, Depends(login_manager)],
 ) -> MessageResponse:
-    if record := session.get(FilmWatchlist, (user.login, film_id)):
-        session.delete(record)
+    if record := await session.get(FilmWatchlist, (user.login, film_id)):
+        await session.delete(record)
     else:
         return MessageResponse(message="Film not found in watchlist")
 
-    session.add(user)
-    session.commit()
+    await session.commit()
+
+    await invalidate_profile(user)
 
     return MessageResponse(message="Film removed from watchlist")
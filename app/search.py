@@ -0,0 +1,189 @@
+"""Search over the locally cached film catalogue.
+
+Titles are matched by substring and similarity via trigram index, titles and
+descriptions - by full-text indexes for every language of the catalogue.
+Films found on Kinopoisk are stored in the catalogue, so it grows over time.
+"""
+
+import asyncio
+import logging
+import os
+import re
+
+from sqlalchemy import ColumnElement, and_, func, literal_column, or_
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.integrations.kinopoisk import get_film_by_id
+from app.models import SEARCH_CONFIGS, USER_FILM_ID_START, Film, film_search_vector
+
+logger = logging.getLogger(__name__)
+
+# Default page size, also how many local films are enough to not ask Kinopoisk
+FILMS_SEARCH_LIMIT = int(os.getenv("FILMS_SEARCH_LIMIT", "20"))
+
+# Filling in details is best-effort, so it must not hold up the request
+FILM_DETAILS_TIMEOUT = float(os.getenv("FILM_DETAILS_TIMEOUT", "3"))  # seconds
+
+WORD = re.compile(r"\w+")
+
+
+def escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def to_prefix_query(search: str) -> str:
+    # Every word may be incomplete, as the user is still typing
+    return " & ".join(f"{word}:*" for word in WORD.findall(search.lower()))
+
+
+def _full_text(search: str, prefix: bool) -> tuple[list, list]:
+    """Full-text conditions and ranks for every configuration."""
+    matches: list[ColumnElement[bool]] = []
+    ranks: list[ColumnElement[float]] = []
+
+    prefix_query = to_prefix_query(search)
+    if prefix and not prefix_query:
+        return matches, ranks
+
+    for config in SEARCH_CONFIGS:
+        regconfig = literal_column(f"'{config}'::regconfig")
+        vector = literal_column(film_search_vector(config))
+
+        if prefix:
+            query = func.to_tsquery(regconfig, prefix_query)
+        else:
+            query = func.plainto_tsquery(regconfig, search)
+
+        matches.append(vector.op("@@")(query))
+        ranks.append(func.ts_rank(vector, query))
+
+    return matches, ranks
+
+
+async def search_films(
+    session: AsyncSession,
+    search: str,
+    genres: list[str] | None = None,
+    limit: int = FILMS_SEARCH_LIMIT,
+    after: tuple[float, int] | None = None,
+) -> list[tuple[Film, float]]:
+    """Films, which title or description match the search, best first.
+
+    Returns films with their score, the page starts right after `after` pair
+    of the score and film id.
+    """
+    matches, ranks = _full_text(search, prefix=False)
+    score = func.greatest(*ranks) + func.similarity(Film.title, search)
+
+    query = select(Film, score).where(
+        or_(
+            Film.title.ilike(f"%{escape_like(search)}%"),  # type: ignore
+            *matches,
+        ),
+        Film.id < USER_FILM_ID_START,
+    )
+    if genres:
+        query = query.where(Film.genres.overlap(genres))  # type: ignore
+    if after is not None:
+        after_score, after_id = after
+        query = query.where(
+            or_(score < after_score, and_(score == after_score, Film.id > after_id))
+        )
+
+    query = query.order_by(score.desc(), Film.id).limit(limit)
+
+    return list((await session.exec(query)).all())
+
+
+async def list_films(
+    session: AsyncSession,
+    genres: list[str] | None = None,
+    limit: int = FILMS_SEARCH_LIMIT,
+    after: tuple[float | None, int] | None = None,
+) -> list[tuple[Film, float | None]]:
+    """Best rated films, of any of genres if given.
+
+    Returns films with their rating, the page starts right after `after` pair
+    of the rating and film id.
+    """
+    query = select(Film, Film.rating).where(Film.id < USER_FILM_ID_START)
+    if genres:
+        query = query.where(Film.genres.overlap(genres))  # type: ignore
+
+    if after is not None:
+        after_rating, after_id = after
+        # Films without rating go last
+        if after_rating is None:
+            query = query.where(Film.rating.is_(None), Film.id > after_id)  # type: ignore
+        else:
+            query = query.where(
+                or_(
+                    Film.rating < after_rating,  # type: ignore
+                    Film.rating.is_(None),  # type: ignore
+                    and_(Film.rating == after_rating, Film.id > after_id),
+                )
+            )
+
+    query = query.order_by(
+        Film.rating.desc().nulls_last(),  # type: ignore
+        Film.id,
+    ).limit(limit)
+
+    return list((await session.exec(query)).all())
+
+
+async def store_films(session: AsyncSession, films: list[Film]) -> None:
+    """Add films to the catalogue, keeping ones which are already there."""
+    if not films:
+        return
+
+    # Same order of rows in all transactions, so they don't deadlock
+    rows = sorted((film.model_dump() for film in films), key=lambda row: row["id"])
+
+    await session.exec(
+        insert(Film).values(rows).on_conflict_do_nothing(index_elements=["id"])  # type: ignore
+    )
+    await session.commit()
+
+
+async def complete_film(session: AsyncSession, film: Film) -> None:
+    """Fill in details of a film, which was stored from search results."""
+    # Search results come without description and link
+    if film.film_url is not None or film.id >= USER_FILM_ID_START:
+        return
+
+    try:
+        async with asyncio.timeout(FILM_DETAILS_TIMEOUT):
+            details = await get_film_by_id(film.id)
+    except Exception:
+        # Partial film is still good to serve
+        logger.exception("Failed to fetch details of film %s", film.id)
+        return
+
+    film.sqlmodel_update(details.model_dump(exclude={"id"}))
+    await session.commit()
+
+
+async def suggest_films(session: AsyncSession, search: str, limit: int) -> list[Film]:
+    """Films, which title or any of its words start with the search."""
+    matches, _ = _full_text(search, prefix=True)
+
+    query = (
+        select(Film)
+        .where(
+            or_(
+                Film.title.ilike(f"{escape_like(search)}%"),  # type: ignore
+                *matches,
+            ),
+            Film.id < USER_FILM_ID_START,
+        )
+        .order_by(
+            func.similarity(Film.title, search).desc(),
+            Film.rating.desc().nulls_last(),  # type: ignore
+        )
+        .limit(limit)
+    )
+
+    return list((await session.exec(query)).all())
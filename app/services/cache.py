@@ -0,0 +1,128 @@
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any
+
+from redis import RedisError
+from redis.asyncio import Redis
+from redis.asyncio.client import Pipeline
+
+logger = logging.getLogger(__name__)
+
+# Returned on cache miss, as `None` is a perfectly valid cached value
+MISSING: Any = object()
+
+
+class LRUCache:
+    """Bounded in-memory cache with per-entry expiry."""
+
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self._data: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: str) -> Any:  # noqa: ANN401
+        entry = self._data.get(key)
+        if entry is None:
+            return MISSING
+
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return MISSING
+
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, ttl: float) -> None:  # noqa: ANN401
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+
+
+class TwoTierCache:
+    """In-memory LRU in front of Redis, storing JSON-serializable values.
+
+    Without `redis` only the in-memory tier is used.
+    """
+
+    def __init__(self, redis: Redis | None, prefix: str, maxsize: int) -> None:
+        self.redis = redis
+        self.prefix = prefix
+        self.local = LRUCache(maxsize)
+
+        self.stats = {"local_hits": 0, "redis_hits": 0, "misses": 0}
+
+    def get_local(self, key: str) -> Any:  # noqa: ANN401
+        value = self.local.get(key)
+        if value is not MISSING:
+            self.stats["local_hits"] += 1
+
+        return value
+
+    def queue_get(self, pipe: Pipeline, key: str) -> None:
+        """Queue reading of `key` into `pipe`, results are passed to `resolve`."""
+        pipe.get(self.prefix + key)
+        pipe.pttl(self.prefix + key)
+
+    def resolve(self, key: str, raw: bytes | None, ttl_ms: int) -> Any:  # noqa: ANN401
+        if raw is None:
+            self.stats["misses"] += 1
+            return MISSING
+
+        self.stats["redis_hits"] += 1
+        value = json.loads(raw)
+
+        if ttl_ms > 0:
+            self.local.set(key, value, ttl_ms / 1000)
+
+        return value
+
+    async def get(self, key: str) -> Any:  # noqa: ANN401
+        value = self.get_local(key)
+        if value is not MISSING:
+            return value
+
+        if self.redis is None:
+            self.stats["misses"] += 1
+            return MISSING
+
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                self.queue_get(pipe, key)
+                raw, ttl_ms = await pipe.execute()
+        except RedisError:
+            logger.warning("Failed to read `%s` from Redis", key, exc_info=True)
+            raw, ttl_ms = None, 0
+
+        return self.resolve(key, raw, ttl_ms)
+
+    async def set(self, key: str, value: Any, ttl: int) -> None:  # noqa: ANN401
+        self.local.set(key, value, ttl)
+
+        if self.redis is None:
+            return
+
+        try:
+            await self.redis.set(self.prefix + key, json.dumps(value), ex=ttl)
+        except RedisError:
+            logger.warning("Failed to store `%s` in Redis", key, exc_info=True)
+
+    async def delete(self, key: str) -> None:
+        self.local.delete(key)
+
+        if self.redis is None:
+            return
+
+        try:
+            await self.redis.delete(self.prefix + key)
+        except RedisError:
+            logger.warning("Failed to delete `%s` from Redis", key, exc_info=True)
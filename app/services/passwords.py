@@ -0,0 +1,70 @@
+import asyncio
+import os
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from typing import TypeVar
+
+from fastapi import HTTPException
+from passlib.context import CryptContext
+from starlette import status
+
+T = TypeVar("T")
+
+# Raising the cost makes existing hashes to be upgraded on next login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+PASSWORD_HASHING_WORKERS = int(os.getenv("PASSWORD_HASHING_WORKERS", "2"))
+PASSWORD_HASHING_QUEUE_SIZE = int(os.getenv("PASSWORD_HASHING_QUEUE_SIZE", "32"))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+)
+
+
+class PasswordHasher:
+    """Runs bcrypt in a bounded thread pool, so it doesn't block the event loop.
+
+    When all workers are busy and the queue is full, requests are rejected
+    with `503` instead of piling up.
+    """
+
+    def __init__(self, workers: int, queue_size: int) -> None:
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers,
+            thread_name_prefix="password-hasher",
+        )
+        self._capacity = workers + queue_size
+        self._pending = 0
+
+    async def _run(self, func: Callable[..., T], *args: str) -> T:
+        if self._pending >= self._capacity:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many authentication requests, try again later",
+                headers={"Retry-After": "1"},
+            )
+
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, func, *args)
+        finally:
+            self._pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(pwd_context.hash, password)
+
+    async def verify_and_update(
+        self, password: str, hashed_password: str
+    ) -> tuple[bool, str | None]:
+        """Verify the password, returning new hash if the current is outdated."""
+        return await self._run(pwd_context.verify_and_update, password, hashed_password)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+password_hasher = PasswordHasher(PASSWORD_HASHING_WORKERS, PASSWORD_HASHING_QUEUE_SIZE)
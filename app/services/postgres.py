@@ -1,17 +1,117 @@
 import os
-from collections.abc import Generator
+import time
+from collections.abc import AsyncGenerator
 from typing import Any
 
-from sqlmodel import Session, SQLModel, create_engine
+from sqlalchemy import exc, make_url, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, ConnectionPoolEntry
+from sqlmodel import SQLModel, create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 DATABASE_URL = os.environ["DATABASE_URL"]
+ASYNC_DATABASE_URL = make_url(DATABASE_URL).set(drivername="postgresql+asyncpg")
+
+# Connection pool, tuned per deployment
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))  # seconds
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # seconds
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in {"1", "true"}
+DB_STATEMENT_TIMEOUT = int(os.getenv("DB_STATEMENT_TIMEOUT", "0"))  # ms, 0 is off
+
+
+class PoolMetrics:
+    def __init__(self) -> None:
+        self.waits = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self.timeouts = 0
+
+    def observe(self, wait_time: float) -> None:
+        self.waits += 1
+        self.wait_time_total += wait_time
+        self.wait_time_max = max(self.wait_time_max, wait_time)
+
+
+pool_metrics = PoolMetrics()
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Pool, which measures how long requests wait for a connection."""
+
+    def _do_get(self) -> ConnectionPoolEntry:
+        # Checkouts served by an idle connection are not waits
+        if self._pool.qsize() > 0:
+            return super()._do_get()
+
+        started = time.perf_counter()
+
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            pool_metrics.timeouts += 1
+            raise
+        finally:
+            pool_metrics.observe(time.perf_counter() - started)
+
+
+# Synchronous engine is only used for schema management and scripts
 engine = create_engine(DATABASE_URL)
 
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    poolclass=InstrumentedPool,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=DB_POOL_PRE_PING,
+    connect_args={
+        "server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT)},
+    },
+)
+async_session_maker = async_sessionmaker(
+    async_engine,
+    class_=AsyncSession,
+    # Objects are used after commit, reloading them would require extra I/O
+    expire_on_commit=False,
+)
+
+
+# Required by indexes
+POSTGRES_EXTENSIONS = ("pg_trgm",)
+
 
 def create_db_and_tables() -> None:
-    SQLModel.metadata.create_all(engine)
+    with engine.begin() as connection:
+        for extension in POSTGRES_EXTENSIONS:
+            connection.execute(text(f"CREATE EXTENSION IF NOT EXISTS {extension}"))
 
+        SQLModel.metadata.create_all(connection)
 
-def get_session() -> Generator[Session, Any, None]:
-    with Session(engine) as session:
+        # `create_all` skips indexes, which were added to existing tables
+        for table in SQLModel.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
+
+
+async def get_async_session() -> AsyncGenerator[AsyncSession, Any]:
+    async with async_session_maker() as session:
         yield session
+
+
+def get_pool_stats() -> dict[str, Any]:
+    pool = async_engine.pool
+
+    return {
+        "size": pool.size(),  # type: ignore
+        "checked_in": pool.checkedin(),  # type: ignore
+        "checked_out": pool.checkedout(),  # type: ignore
+        "overflow": pool.overflow(),  # type: ignore
+        "max_overflow": DB_MAX_OVERFLOW,
+        "waits": pool_metrics.waits,
+        "wait_time_total": pool_metrics.wait_time_total,
+        "wait_time_max": pool_metrics.wait_time_max,
+        "timeouts": pool_metrics.timeouts,
+    }
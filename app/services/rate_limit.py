@@ -0,0 +1,124 @@
+import logging
+import os
+import uuid
+from typing import Annotated
+
+from fastapi import Form, HTTPException, Request
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from starlette import status
+
+from app.services.redis import async_redis_session
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_WINDOW = int(os.getenv("RATE_LIMIT_WINDOW", "60"))
+LOGIN_ATTEMPTS_PER_IP = int(os.getenv("LOGIN_ATTEMPTS_PER_IP", "30"))
+LOGIN_ATTEMPTS_PER_LOGIN = int(os.getenv("LOGIN_ATTEMPTS_PER_LOGIN", "10"))
+REGISTER_ATTEMPTS_PER_IP = int(os.getenv("REGISTER_ATTEMPTS_PER_IP", "10"))
+REGISTER_ATTEMPTS_PER_LOGIN = int(os.getenv("REGISTER_ATTEMPTS_PER_LOGIN", "10"))
+
+# Sliding window over sorted sets of attempt timestamps. The attempt is
+# recorded only if every window has room, otherwise returns milliseconds
+# until the fullest window frees up.
+# KEYS: window of every identifier
+# ARGV: window in milliseconds, attempt id, then limit of every window
+SLIDING_WINDOW_SCRIPT = """
+local time = redis.call("TIME")
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local window = tonumber(ARGV[1])
+local retry_after = 0
+
+for i = 1, #KEYS do
+    redis.call("ZREMRANGEBYSCORE", KEYS[i], "-inf", now - window)
+
+    if redis.call("ZCARD", KEYS[i]) >= tonumber(ARGV[i + 2]) then
+        local oldest = redis.call("ZRANGE", KEYS[i], 0, 0, "WITHSCORES")
+        retry_after = math.max(retry_after, tonumber(oldest[2]) + window - now)
+    end
+end
+
+if retry_after > 0 then
+    return retry_after
+end
+
+for i = 1, #KEYS do
+    redis.call("ZADD", KEYS[i], now, ARGV[2])
+    redis.call("PEXPIRE", KEYS[i], window)
+end
+
+return 0
+"""
+
+
+def get_client_ip(request: Request) -> str:
+    # Set by nginx in front of the app
+    real_ip = request.headers.get("X-Real-IP")
+
+    if real_ip:
+        return real_ip
+
+    return request.client.host if request.client else "unknown"
+
+
+class RateLimiter:
+    """Dependency limiting attempts per client IP and per submitted login.
+
+    Meant to run before any expensive work (like password hashing) is done.
+    If Redis is unavailable, requests are let through.
+    """
+
+    def __init__(
+        self,
+        scope: str,
+        ip_limit: int,
+        login_limit: int,
+        window: int = RATE_LIMIT_WINDOW,
+        redis: Redis = async_redis_session,
+    ) -> None:
+        self.scope = scope
+        self.ip_limit = ip_limit
+        self.login_limit = login_limit
+        self.window = window
+
+        self._hit = redis.register_script(SLIDING_WINDOW_SCRIPT)
+
+    def _key(self, kind: str, identifier: str) -> str:
+        return f"rate_limit:{self.scope}:{kind}:{identifier}"
+
+    async def __call__(
+        self, request: Request, username: Annotated[str, Form()]
+    ) -> None:
+        keys = [
+            self._key("ip", get_client_ip(request)),
+            self._key("login", username.strip().lower()),
+        ]
+
+        try:
+            retry_after_ms = await self._hit(
+                keys=keys,
+                args=[
+                    self.window * 1000,
+                    uuid.uuid4().hex,
+                    self.ip_limit,
+                    self.login_limit,
+                ],
+            )
+        except RedisError:
+            logger.warning("Failed to check rate limit", exc_info=True)
+            return
+
+        if retry_after_ms:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many attempts, try again later",
+                headers={"Retry-After": str(-(-int(retry_after_ms) // 1000))},
+            )
+
+
+login_rate_limiter = RateLimiter(
+    "login", LOGIN_ATTEMPTS_PER_IP, LOGIN_ATTEMPTS_PER_LOGIN
+)
+register_rate_limiter = RateLimiter(
+    "register", REGISTER_ATTEMPTS_PER_IP, REGISTER_ATTEMPTS_PER_LOGIN
+)
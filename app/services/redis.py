@@ -1,7 +1,31 @@
 import os
 
-import redis
+import redis.asyncio
+from redis.asyncio import Redis
 
 REDIS_URL = os.environ["REDIS_URL"]
 
-redis_session = redis.from_url(REDIS_URL)
+# Connection pool, tuned per deployment
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", "5"))  # seconds
+# Should exceed timeouts of blocking commands, like BLMOVE in workers
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "10"))  # seconds
+REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", "2"))  # seconds
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", "30"))
+
+# Waits for a free connection instead of failing when the pool is exhausted
+redis_pool = redis.asyncio.BlockingConnectionPool.from_url(
+    REDIS_URL,
+    max_connections=REDIS_MAX_CONNECTIONS,
+    timeout=REDIS_POOL_TIMEOUT,
+    socket_timeout=REDIS_SOCKET_TIMEOUT,
+    socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+    health_check_interval=REDIS_HEALTH_CHECK_INTERVAL,
+)
+
+# Client owns the pool, so closing the client disconnects the pool as well
+async_redis_session = Redis.from_pool(redis_pool)
+
+
+def get_redis() -> Redis:
+    return async_redis_session
@@ -0,0 +1,130 @@
+import os
+from typing import Annotated
+
+from fastapi import Depends
+from redis.asyncio import Redis
+
+from app.services.redis import get_redis
+
+# Abandoned sessions expire by themselves
+SESSION_TTL = int(os.getenv("SESSION_TTL", str(3 * 60 * 60)))  # seconds
+
+# Starts the session, unless any of the users is already in one.
+# KEYS: state of the first user, state of the second user, session state, deck
+# ARGV: session id, TTL, then logins of both users
+START_SESSION_SCRIPT = """
+if redis.call("EXISTS", KEYS[1], KEYS[2]) > 0 then
+    return 0
+end
+
+redis.call("SET", KEYS[1], ARGV[1], "EX", ARGV[2])
+redis.call("SET", KEYS[2], ARGV[1], "EX", ARGV[2])
+redis.call("DEL", KEYS[3], KEYS[4])
+redis.call("HSET", KEYS[3], "first", ARGV[3], "second", ARGV[4])
+redis.call("EXPIRE", KEYS[3], ARGV[2])
+
+return 1
+"""
+
+# Ends the session, only if both users are still in it.
+# KEYS: state of the first user, state of the second user, session state, deck
+# ARGV: session id
+END_SESSION_SCRIPT = """
+if redis.call("GET", KEYS[1]) ~= ARGV[1] or redis.call("GET", KEYS[2]) ~= ARGV[1] then
+    return 0
+end
+
+redis.call("DEL", KEYS[1], KEYS[2], KEYS[3], KEYS[4])
+
+return 1
+"""
+
+
+class WatchSessions:
+    """Watch-together sessions between two users, stored in Redis.
+
+    Every user may take part in one session at a time. Sessions are
+    identified by the sorted pair of logins, so it doesn't matter which of
+    the users started it.
+
+    Ranked candidates (the deck) are computed once, when the session starts,
+    and then served page by page.
+    """
+
+    def __init__(self, redis: Redis, ttl: int = SESSION_TTL) -> None:
+        self.redis = redis
+        self.ttl = ttl
+
+        self._start = redis.register_script(START_SESSION_SCRIPT)
+        self._end = redis.register_script(END_SESSION_SCRIPT)
+
+    @staticmethod
+    def session_id(login: str, other_login: str) -> str:
+        return ":".join(sorted((login, other_login)))
+
+    @staticmethod
+    def _user_key(login: str) -> str:
+        return f"session:user:{login}"
+
+    def _deck_key(self, login: str, other_login: str) -> str:
+        return f"session:deck:{self.session_id(login, other_login)}"
+
+    def _keys(self, login: str, other_login: str) -> list[str]:
+        first, second = sorted((login, other_login))
+
+        return [
+            self._user_key(first),
+            self._user_key(second),
+            f"session:pair:{self.session_id(first, second)}",
+            self._deck_key(first, second),
+        ]
+
+    async def start(self, login: str, other_login: str) -> bool:
+        """Start the session, returning `False` if any user is already in one."""
+        started = await self._start(
+            keys=self._keys(login, other_login),
+            args=[
+                self.session_id(login, other_login),
+                self.ttl,
+                *sorted((login, other_login)),
+            ],
+        )
+
+        return bool(started)
+
+    async def end(self, login: str, other_login: str) -> bool:
+        """End the session, returning `False` if there was no such session."""
+        ended = await self._end(
+            keys=self._keys(login, other_login),
+            args=[self.session_id(login, other_login)],
+        )
+
+        return bool(ended)
+
+    async def save_deck(self, login: str, other_login: str, cards: list[str]) -> None:
+        key = self._deck_key(login, other_login)
+
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.delete(key)
+            if cards:
+                pipe.rpush(key, *cards)
+            pipe.expire(key, self.ttl)
+            await pipe.execute()
+
+    async def get_deck(
+        self, login: str, other_login: str, cursor: int, limit: int
+    ) -> list[bytes] | None:
+        """Page of the deck, or `None` if the users aren't in this session."""
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.get(self._user_key(login))
+            pipe.lrange(self._deck_key(login, other_login), cursor, cursor + limit - 1)
+            current_session, cards = await pipe.execute()
+
+        if current_session != self.session_id(login, other_login).encode():
+            return None
+
+        return cards
+
+
+def get_watch_sessions(redis: Annotated[Redis, Depends(get_redis)]) -> WatchSessions:
+    return WatchSessions(redis)
@@ -0,0 +1,153 @@
+"""Pre-generates discussion themes for films, queued through Redis.
+
+Run with `python -m app.workers.discussions`.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+
+from redis import RedisError
+
+from app.integrations import gemini
+from app.services.redis import async_redis_session
+
+logger = logging.getLogger(__name__)
+
+QUEUE_KEY = "discussions:queue"
+# Jobs taken by the worker, returned to the queue if it dies midway
+PROCESSING_KEY = "discussions:processing"
+QUEUED_KEY = "discussions:queued:{}"
+QUEUED_TTL = 60 * 60  # seconds
+
+# Free models are rate limited by the provider
+REQUESTS_PER_MINUTE = int(os.getenv("DISCUSSIONS_WORKER_RPM", "10"))
+MAX_ATTEMPTS = 3
+RETRY_BACKOFF = 5  # seconds, doubled on every attempt
+
+
+async def enqueue_discussions(film_name: str, year: int | None) -> None:
+    """Queue theme generation, unless the themes are cached or already queued."""
+    if year is None:
+        return
+
+    key = gemini.get_cache_key(film_name, year)
+
+    try:
+        async with async_redis_session.pipeline(transaction=False) as pipe:
+            pipe.exists(gemini.discussions_cache.prefix + key)
+            pipe.set(QUEUED_KEY.format(key), 1, nx=True, ex=QUEUED_TTL)
+            cached, queued = await pipe.execute()
+
+        if cached or not queued:
+            return
+
+        job = {"film_name": film_name, "year": year}
+        await async_redis_session.lpush(QUEUE_KEY, json.dumps(job))
+
+    except RedisError:
+        logger.warning("Failed to queue discussions for %s", film_name, exc_info=True)
+
+
+class Throttle:
+    """Spaces calls to the model evenly, to stay within the rate limit."""
+
+    def __init__(self, requests_per_minute: int) -> None:
+        self.interval = 60 / requests_per_minute
+        self.last_request = 0.0
+
+    async def wait(self) -> None:
+        await asyncio.sleep(
+            max(self.last_request + self.interval - time.monotonic(), 0)
+        )
+        self.last_request = time.monotonic()
+
+
+async def process(film_name: str, year: int, throttle: Throttle) -> None:
+    key = gemini.get_cache_key(film_name, year)
+
+    try:
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            # Retries count towards the rate limit as well
+            await throttle.wait()
+
+            try:
+                themes = await gemini.generate_discussions(film_name, year)
+            except Exception:
+                logger.warning(
+                    "Attempt %s to generate discussions for %s failed",
+                    attempt,
+                    film_name,
+                    exc_info=True,
+                )
+            else:
+                if themes:
+                    await gemini.discussions_cache.set(
+                        key, themes, gemini.DISCUSSIONS_CACHE_TTL
+                    )
+                break
+
+            if attempt < MAX_ATTEMPTS:
+                await asyncio.sleep(RETRY_BACKOFF * 2 ** (attempt - 1))
+    finally:
+        await async_redis_session.delete(QUEUED_KEY.format(key))
+
+
+async def requeue_unfinished() -> None:
+    """Return jobs, which a previous run didn't finish, to the queue.
+
+    Assumes a single worker, as jobs of a running one would be taken as well.
+    """
+    while await async_redis_session.lmove(PROCESSING_KEY, QUEUE_KEY, "RIGHT", "RIGHT"):
+        pass
+
+
+async def run() -> None:
+    throttle = Throttle(REQUESTS_PER_MINUTE)
+
+    try:
+        await requeue_unfinished()
+    except RedisError:
+        logger.warning("Failed to requeue unfinished discussions", exc_info=True)
+
+    logger.info("Discussions worker started")
+
+    while True:
+        try:
+            payload = await async_redis_session.blmove(
+                QUEUE_KEY, PROCESSING_KEY, timeout=5, src="RIGHT", dest="LEFT"
+            )
+        except RedisError:
+            logger.warning("Failed to read discussions queue", exc_info=True)
+            await asyncio.sleep(RETRY_BACKOFF)
+            continue
+
+        if payload is None:
+            continue
+
+        job = json.loads(payload)
+
+        try:
+            await process(job["film_name"], job["year"], throttle)
+        except Exception:
+            logger.exception("Failed to process discussions job %s", job)
+
+        try:
+            await async_redis_session.lrem(PROCESSING_KEY, 1, payload)
+        except RedisError:
+            logger.warning("Failed to finish discussions job %s", job, exc_info=True)
+
+
+async def main() -> None:
+    try:
+        await run()
+    finally:
+        await gemini.client.close()
+        await async_redis_session.aclose()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
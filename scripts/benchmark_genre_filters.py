@@ -0,0 +1,101 @@
+"""Benchmark of genre filters over a large catalogue, with and without indexes.
+
+Seeds a copy of the `film` table in a scratch schema, which is dropped after.
+Run from the repository root, against a database the app uses:
+
+    DATABASE_URL=postgresql://... PYTHONPATH=. python scripts/benchmark_genre_filters.py
+"""
+
+import os
+import random
+import time
+
+from sqlalchemy import Connection, MetaData, create_engine, text
+
+from app.models import Film
+
+SCHEMA = "benchmark"
+CATALOGUE_SIZE = int(os.getenv("BENCHMARK_CATALOGUE_SIZE", "500000"))
+REPEATS = 20
+
+GENRES = [
+    "драма", "комедия", "боевик", "триллер", "ужасы", "мелодрама", "фэнтези",
+    "фантастика", "детектив", "криминал", "приключения", "биография", "история",
+    "военный", "вестерн", "мультфильм", "аниме", "документальный", "мюзикл",
+    "семейный", "спорт", "музыка", "короткометражка", "детский", "нуар",
+]  # fmt: skip
+BENCHMARKED_INDEXES = {"ix_film_genres", "ix_film_rating"}
+
+QUERIES = {
+    "rare genre": (
+        f"SELECT id FROM {SCHEMA}.film WHERE genres && ARRAY['нуар']::varchar[]"
+    ),
+    "two rare genres": (
+        f"SELECT id FROM {SCHEMA}.film"
+        " WHERE genres && ARRAY['нуар', 'вестерн']::varchar[]"
+    ),
+    "top rated of genre": (
+        f"SELECT id FROM {SCHEMA}.film WHERE genres && ARRAY['драма']::varchar[]"
+        " ORDER BY rating DESC NULLS LAST LIMIT 20"
+    ),
+}
+
+
+def seed(connection: Connection) -> None:
+    metadata = MetaData(schema=SCHEMA)
+    table = Film.__table__.to_metadata(metadata)  # type: ignore
+    table.indexes = {
+        index for index in table.indexes if index.name in BENCHMARKED_INDEXES
+    }
+
+    connection.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+    metadata.create_all(connection)
+
+    # Genres are skewed, like in a real catalogue
+    weights = [1 / rank for rank in range(1, len(GENRES) + 1)]
+    rows = [
+        {
+            "id": i,
+            "title": f"Film {i}",
+            "genres": list(set(random.choices(GENRES, weights, k=2))),
+            "rating": round(random.uniform(1, 10), 1),
+        }
+        for i in range(CATALOGUE_SIZE)
+    ]
+    connection.execute(table.insert(), rows)
+    connection.execute(text(f"ANALYZE {SCHEMA}.film"))
+
+
+def measure(connection: Connection, query: str) -> float:
+    started = time.perf_counter()
+    for _ in range(REPEATS):
+        connection.execute(text(query)).all()
+
+    return (time.perf_counter() - started) / REPEATS * 1000
+
+
+def main() -> None:
+    random.seed(0)
+    engine = create_engine(os.environ["DATABASE_URL"])
+
+    with engine.connect() as connection:
+        try:
+            print(f"Seeding {CATALOGUE_SIZE} films...")
+            seed(connection)
+
+            indexed = {name: measure(connection, q) for name, q in QUERIES.items()}
+
+            for index in BENCHMARKED_INDEXES:
+                connection.execute(text(f"DROP INDEX {SCHEMA}.{index}"))
+
+            plain = {name: measure(connection, q) for name, q in QUERIES.items()}
+        finally:
+            connection.rollback()
+
+    print(f"{'query':<20} {'no index, ms':>13} {'indexed, ms':>12}")
+    for name in QUERIES:
+        print(f"{name:<20} {plain[name]:>13.2f} {indexed[name]:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Benchmark of session candidates ranking on large Kinopoisk responses.
+
+Run from the repository root:
+
+    PYTHONPATH=. python scripts/benchmark_session_ranking.py
+
+Time per film should stay flat as the number of films grows.
+"""
+
+import random
+import timeit
+
+from app.models import Film
+from app.ranking import rank_fallback
+
+GENRES = ["драма", "комедия", "боевик", "триллер", "ужасы", "мелодрама", "фэнтези"]
+SIZES = [1_000, 2_000, 4_000, 8_000, 16_000]
+GENRES_FETCHED = 5
+REPEATS = 5
+
+
+def make_films(count: int, offset: int = 0) -> list[Film]:
+    return [
+        Film(
+            id=offset + i,
+            title=f"Film {offset + i}",
+            image_url="https://example.com/poster.jpg",
+            genres=random.sample(GENRES, k=random.randint(1, 3)),
+            rating=round(random.uniform(1, 10), 1),
+        )
+        for i in range(count)
+    ]
+
+
+def main() -> None:
+    random.seed(0)
+    requested = GENRES[:3]
+
+    print(f"{'films':>8} {'ms':>8} {'ns/film':>8}")
+    for size in SIZES:
+        # Every genre returns a share of films, overlapping with each other
+        # and with the deck taken from watchlists
+        catalogue = make_films(size)
+        films_by_genre = [
+            random.sample(catalogue, size // GENRES_FETCHED)
+            for _ in range(GENRES_FETCHED)
+        ]
+        taken = random.sample(catalogue, size // 10)
+
+        elapsed = timeit.timeit(
+            lambda: rank_fallback(films_by_genre, taken, requested),  # noqa: B023
+            number=REPEATS,
+        )
+
+        per_film = elapsed / REPEATS / size * 1e9
+        print(f"{size:>8} {elapsed / REPEATS * 1000:>8.2f} {per_film:>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+import os
+
+# Modules read their settings on import, services are never connected to
+os.environ.setdefault("REDIS_URL", "redis://localhost:6379/0")
+os.environ.setdefault("KINOPOISK_API_KEYS", "test")
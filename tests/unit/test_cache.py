@@ -0,0 +1,42 @@
+import pytest
+
+from app.services.cache import MISSING, LRUCache
+
+
+def test_lru_cache_get_set() -> None:
+    cache = LRUCache(maxsize=2)
+    cache.set("film:1", {"id": 1}, ttl=60)
+
+    assert cache.get("film:1") == {"id": 1}
+    assert cache.get("film:2") is MISSING
+
+
+def test_lru_cache_stores_none() -> None:
+    cache = LRUCache(maxsize=2)
+    cache.set("film:404", None, ttl=60)
+
+    assert cache.get("film:404") is None
+
+
+def test_lru_cache_evicts_least_recently_used() -> None:
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1, ttl=60)
+    cache.set("b", 2, ttl=60)
+
+    # Touch `a`, so `b` becomes the oldest entry
+    cache.get("a")
+    cache.set("c", 3, ttl=60)
+
+    assert len(cache) == 2  # noqa: PLR2004
+    assert cache.get("b") is MISSING
+    assert cache.get("a") == 1
+
+
+def test_lru_cache_expires(monkeypatch: pytest.MonkeyPatch) -> None:
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1, ttl=10)
+
+    monkeypatch.setattr("time.monotonic", lambda: float("inf"))
+
+    assert cache.get("a") is MISSING
+    assert len(cache) == 0
@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+
+from app.integrations.kinopoisk import SingleFlight
+
+
+def test_single_flight_runs_call_once() -> None:
+    calls = 0
+
+    async def fetch() -> int:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return 42
+
+    async def main() -> list[int]:
+        in_flight = SingleFlight()
+        results = await asyncio.gather(*(in_flight.do("a", fetch) for _ in range(10)))
+
+        assert len(in_flight) == 0
+        return results
+
+    assert asyncio.run(main()) == [42] * 10
+    assert calls == 1
+
+
+def test_single_flight_passes_error_to_every_waiter() -> None:
+    async def fetch() -> int:
+        await asyncio.sleep(0.01)
+        raise ValueError
+
+    async def main() -> list[BaseException | int]:
+        in_flight = SingleFlight()
+        return await asyncio.gather(
+            *(in_flight.do("a", fetch) for _ in range(3)),
+            return_exceptions=True,
+        )
+
+    results = asyncio.run(main())
+
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_single_flight_survives_cancelled_waiter() -> None:
+    async def fetch() -> int:
+        await asyncio.sleep(0.01)
+        return 42
+
+    async def main() -> int:
+        in_flight = SingleFlight()
+        cancelled = asyncio.ensure_future(in_flight.do("a", fetch))
+        waiter = asyncio.ensure_future(in_flight.do("a", fetch))
+
+        await asyncio.sleep(0)
+        cancelled.cancel()
+
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+
+        return await waiter
+
+    assert asyncio.run(main()) == 42  # noqa: PLR2004
+
+
+def test_single_flight_keys_are_independent() -> None:
+    async def main() -> list[str]:
+        in_flight = SingleFlight()
+
+        async def fetch(value: str) -> str:
+            await asyncio.sleep(0.01)
+            return value
+
+        return await asyncio.gather(
+            in_flight.do("a", lambda: fetch("a")),
+            in_flight.do("b", lambda: fetch("b")),
+        )
+
+    assert asyncio.run(main()) == ["a", "b"]
@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from redis.asyncio import Redis
+from starlette.requests import Request
+
+from app.services.rate_limit import RateLimiter
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+def make_request(ip: str = "10.0.0.1") -> Request:
+    return Request(
+        {
+            "type": "http",
+            "method": "POST",
+            "path": "/auth/login",
+            "headers": [(b"x-real-ip", ip.encode())],
+            "client": ("127.0.0.1", 12345),
+        }
+    )
+
+
+def make_limiter(redis: Redis | None = None) -> RateLimiter:
+    return RateLimiter(
+        "login",
+        ip_limit=5,
+        login_limit=2,
+        window=60,
+        redis=redis or fakeredis.FakeAsyncRedis(),
+    )
+
+
+def test_rate_limiter_blocks_after_limit() -> None:
+    async def main() -> HTTPException:
+        limiter = make_limiter()
+        for _ in range(2):
+            await limiter(make_request(), "user_1")
+
+        with pytest.raises(HTTPException) as error:
+            await limiter(make_request(), "user_1")
+
+        return error.value
+
+    error = asyncio.run(main())
+
+    assert error.status_code == 429  # noqa: PLR2004
+    assert 0 < int(error.headers["Retry-After"]) <= 60  # noqa: PLR2004
+
+
+def test_rate_limiter_normalizes_login() -> None:
+    async def main() -> None:
+        limiter = make_limiter()
+        await limiter(make_request(), "user_1")
+        await limiter(make_request(), " USER_1")
+
+        await limiter(make_request(), "User_1 ")
+
+    with pytest.raises(HTTPException):
+        asyncio.run(main())
+
+
+def test_rate_limiter_allows_other_logins() -> None:
+    async def main() -> None:
+        limiter = make_limiter()
+        for _ in range(2):
+            await limiter(make_request(), "user_1")
+
+        await limiter(make_request(), "user_2")
+
+    asyncio.run(main())
+
+
+def test_rate_limiter_limits_ip() -> None:
+    async def main() -> None:
+        limiter = make_limiter()
+        for i in range(5):
+            await limiter(make_request(), f"user_{i}")
+
+        # Another client is unaffected
+        await limiter(make_request("10.0.0.2"), "user_5")
+
+        await limiter(make_request(), "user_5")
+
+    with pytest.raises(HTTPException):
+        asyncio.run(main())
+
+
+def test_rate_limiter_fails_open() -> None:
+    server = fakeredis.FakeServer()
+    server.connected = False
+
+    async def main() -> None:
+        limiter = make_limiter(fakeredis.FakeAsyncRedis(server=server))
+        for _ in range(3):
+            await limiter(make_request(), "user_1")
+
+    asyncio.run(main())
@@ -0,0 +1,101 @@
+import asyncio
+from collections import Counter
+
+import pytest
+
+from app.integrations import kinopoisk
+from app.integrations.kinopoisk import OutOfTokensError, TokenScheduler
+
+fakeredis = pytest.importorskip("fakeredis")
+
+TOKENS = ["token-a", "token-b", "token-c"]
+
+
+def make_scheduler() -> TokenScheduler:
+    return TokenScheduler(TOKENS, fakeredis.FakeAsyncRedis())
+
+
+def test_token_scheduler_rotates_least_used() -> None:
+    async def main() -> list[str]:
+        scheduler = make_scheduler()
+        return [await scheduler.acquire() for _ in range(6)]
+
+    acquired = asyncio.run(main())
+
+    assert set(acquired[:3]) == set(TOKENS)
+    assert Counter(acquired) == dict.fromkeys(TOKENS, 2)
+
+
+def test_token_scheduler_respects_daily_quota(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(kinopoisk, "KINOPOISK_DAILY_QUOTA", 1)
+
+    async def main() -> list[str]:
+        scheduler = make_scheduler()
+        acquired = [await scheduler.acquire() for _ in TOKENS]
+
+        with pytest.raises(OutOfTokensError):
+            await scheduler.acquire()
+
+        return acquired
+
+    assert sorted(asyncio.run(main())) == TOKENS
+
+
+def test_token_scheduler_skips_token_out_of_quota() -> None:
+    async def main() -> tuple[set[str], int]:
+        scheduler = make_scheduler()
+        await scheduler.report("token-a", 402)
+
+        acquired = {await scheduler.acquire() for _ in range(4)}
+        ttl = await scheduler.redis.ttl(
+            scheduler._cooldown_key(scheduler.fingerprint("token-a"))  # noqa: SLF001
+        )
+        return acquired, ttl
+
+    acquired, ttl = asyncio.run(main())
+
+    assert acquired == {"token-b", "token-c"}
+    # Cooling down until the quota resets at midnight UTC
+    assert 0 < ttl <= 24 * 60 * 60
+
+
+def test_token_scheduler_recovers_after_rate_limit() -> None:
+    async def main() -> tuple[set[str], set[str]]:
+        scheduler = make_scheduler()
+        for token in TOKENS[:2]:
+            await scheduler.report(token, 429)
+
+        cooling = {await scheduler.acquire() for _ in range(3)}
+
+        await asyncio.sleep(kinopoisk.KINOPOISK_RATE_LIMIT_COOLDOWN + 0.1)
+        # The recovered tokens are the least used ones now
+        recovered = {await scheduler.acquire() for _ in range(2)}
+
+        return cooling, recovered
+
+    cooling, recovered = asyncio.run(main())
+
+    assert cooling == {"token-c"}
+    assert recovered == {"token-a", "token-b"}
+
+
+def test_token_scheduler_runs_out_of_tokens() -> None:
+    async def main() -> None:
+        scheduler = make_scheduler()
+        for token in TOKENS:
+            await scheduler.report(token, 402)
+
+        await scheduler.acquire()
+
+    with pytest.raises(OutOfTokensError):
+        asyncio.run(main())
+
+
+def test_token_scheduler_ignores_other_statuses() -> None:
+    async def main() -> set[str]:
+        scheduler = make_scheduler()
+        await scheduler.report("token-a", 500)
+
+        return {await scheduler.acquire() for _ in range(3)}
+
+    assert asyncio.run(main()) == set(TOKENS)
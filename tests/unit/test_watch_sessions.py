@@ -0,0 +1,126 @@
+import asyncio
+
+import pytest
+
+from app.services.watch_sessions import SESSION_TTL, WatchSessions
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+def make_sessions() -> WatchSessions:
+    return WatchSessions(fakeredis.FakeAsyncRedis())
+
+
+def test_session_id_ignores_order() -> None:
+    assert WatchSessions.session_id("user_1", "user_2") == WatchSessions.session_id(
+        "user_2", "user_1"
+    )
+
+
+def test_start_refused_while_active() -> None:
+    async def main() -> list[bool]:
+        sessions = make_sessions()
+
+        return [
+            await sessions.start("user_1", "user_2"),
+            await sessions.start("user_2", "user_1"),
+            # Both users may only take part in one session at a time
+            await sessions.start("user_1", "user_3"),
+            await sessions.start("user_3", "user_2"),
+            await sessions.start("user_3", "user_4"),
+        ]
+
+    assert asyncio.run(main()) == [True, False, False, False, True]
+
+
+def test_end_refused_for_wrong_pair() -> None:
+    async def main() -> list[bool]:
+        sessions = make_sessions()
+        await sessions.start("user_1", "user_2")
+        await sessions.start("user_3", "user_4")
+
+        return [
+            await sessions.end("user_1", "user_3"),
+            await sessions.end("user_2", "user_4"),
+            await sessions.end("user_2", "user_1"),
+            # Already ended
+            await sessions.end("user_1", "user_2"),
+        ]
+
+    assert asyncio.run(main()) == [False, False, True, False]
+
+
+def test_start_after_end() -> None:
+    async def main() -> bool:
+        sessions = make_sessions()
+        await sessions.start("user_1", "user_2")
+        await sessions.end("user_1", "user_2")
+
+        return await sessions.start("user_1", "user_3")
+
+    assert asyncio.run(main())
+
+
+def test_session_expires() -> None:
+    async def main() -> tuple[int, int]:
+        sessions = make_sessions()
+        await sessions.start("user_1", "user_2")
+
+        return (
+            await sessions.redis.ttl("session:user:user_1"),
+            await sessions.redis.ttl("session:pair:user_1:user_2"),
+        )
+
+    for ttl in asyncio.run(main()):
+        assert 0 < ttl <= SESSION_TTL
+
+
+def test_deck_pages() -> None:
+    cards = [f'{{"id": {i}}}' for i in range(25)]
+
+    async def main() -> list[list[bytes] | None]:
+        sessions = make_sessions()
+        await sessions.start("user_1", "user_2")
+        await sessions.save_deck("user_1", "user_2", cards)
+
+        return [
+            await sessions.get_deck("user_1", "user_2", 0, 10),
+            await sessions.get_deck("user_2", "user_1", 10, 10),
+            await sessions.get_deck("user_1", "user_2", 20, 10),
+            await sessions.get_deck("user_1", "user_2", 30, 10),
+        ]
+
+    pages = asyncio.run(main())
+    encoded = [card.encode() for card in cards]
+
+    assert pages == [encoded[:10], encoded[10:20], encoded[20:], []]
+
+
+def test_deck_replaced_on_save() -> None:
+    async def main() -> list[bytes] | None:
+        sessions = make_sessions()
+        await sessions.start("user_1", "user_2")
+        await sessions.save_deck("user_1", "user_2", ["a", "b", "c"])
+        await sessions.save_deck("user_1", "user_2", ["d"])
+
+        return await sessions.get_deck("user_1", "user_2", 0, 10)
+
+    assert asyncio.run(main()) == [b"d"]
+
+
+def test_deck_outside_session() -> None:
+    async def main() -> list[list[bytes] | None]:
+        sessions = make_sessions()
+        await sessions.start("user_1", "user_2")
+        await sessions.save_deck("user_1", "user_2", ["a"])
+
+        not_started = await sessions.get_deck("user_1", "user_3", 0, 10)
+        outsider = await sessions.get_deck("user_3", "user_1", 0, 10)
+
+        await sessions.end("user_1", "user_2")
+        ended = await sessions.get_deck("user_1", "user_2", 0, 10)
+
+        return [not_started, outsider, ended]
+
+    # Served as 404 by `/session/next`
+    assert asyncio.run(main()) == [None, None, None]